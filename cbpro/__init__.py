@@ -1,11 +1,26 @@
 from cbpro.auth import Auth
 from cbpro.messenger import Messenger
+from cbpro.messenger import Pool
+from cbpro.messenger import ResponseError
+from cbpro.limiter import TokenBucket
+from cbpro.limiter import Limiter
+from cbpro.limiter import Backoff
+from cbpro.cache import Cache
+from cbpro.codec import get_codec
 
 from cbpro.public import PublicClient
 from cbpro.public import public_client
 from cbpro.private import PrivateClient
 from cbpro.private import private_client
 
+from cbpro.aio import AsyncMessenger
+from cbpro.aio import AsyncPublicClient
+from cbpro.aio import async_public_client
+from cbpro.aio import AsyncPrivateClient
+from cbpro.aio import async_private_client
+
+from cbpro.store import CandleStore
+
 from cbpro.models import PublicModel
 from cbpro.models import PrivateModel
 
@@ -13,4 +28,9 @@ from cbpro.websocket import get_message
 from cbpro.websocket import WebsocketHeader
 from cbpro.websocket import WebsocketStream
 from cbpro.websocket import WebsocketEvent
-from cbpro.websocket import WebsocketClient
\ No newline at end of file
+from cbpro.websocket import WebsocketClient
+
+from cbpro.bars import BarBuilder
+from cbpro.order_book import OrderBook
+from cbpro.order_book import OrderBooks
+from cbpro.order_book import Level2Book
\ No newline at end of file
@@ -0,0 +1,445 @@
+#
+# Asyncio mirrors of the REST clients
+#
+# NOTE:
+#   - Requires `aiohttp`: pip install cbpro[async]
+#   - The endpoint classes are shared with the synchronous clients;
+#     their methods return coroutines (or async generators for
+#     paginated endpoints) when backed by an `AsyncMessenger`
+#   - A `cbpro.limiter.Limiter` may be shared with synchronous messengers
+import asyncio
+import collections
+import functools
+import itertools
+import time
+import urllib.parse
+
+import cbpro.auth
+import cbpro.cache
+import cbpro.codec
+import cbpro.limiter
+import cbpro.messenger
+import cbpro.private
+import cbpro.public
+
+from iso8601 import parse_date
+
+
+class Response(object):
+    # NOTE:
+    #   - The body is read before the connection is released
+    #   - Attribute names follow `requests.Response`
+    def __init__(self, status_code: int, headers: dict, content: bytes) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+class AsyncMessenger(object):
+    def __init__(self,
+                 auth: cbpro.auth.Auth = None,
+                 url: str = None,
+                 timeout: int = None,
+                 limiter: cbpro.limiter.Limiter = None,
+                 backoff: cbpro.limiter.Backoff = None,
+                 cache: cbpro.cache.Cache = None,
+                 coalesce: bool = True,
+                 codec: cbpro.codec.Codec = None) -> None:
+
+        api = 'https://api.pro.coinbase.com'
+        self.auth = auth
+        self.url = api if url is None else url.rstrip('/')
+        self.timeout = 30 if timeout is None else timeout
+        self.limiter = cbpro.limiter.Limiter() if limiter is None else limiter
+        self.backoff = cbpro.limiter.Backoff() if backoff is None else backoff
+        self.cache = cache
+        self.flights = dict() if coalesce else None
+        self.codec = cbpro.codec.get_codec() if codec is None else codec
+        self.session = None
+
+    async def __aenter__(self) -> 'AsyncMessenger':
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def open(self) -> object:
+        import aiohttp
+
+        if self.session is None or self.session.closed:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self.session = aiohttp.ClientSession(timeout=timeout)
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def route(self, endpoint: str) -> str:
+        return f'{self.url}{endpoint}'
+
+    def decode(self, response: Response) -> object:
+        return self.codec.loads(response.content)
+
+    async def throttle(self, private: bool = None) -> float:
+        # NOTE: Reserve from the shared bucket without blocking the loop
+        if private is None:
+            private = self.auth is not None
+        delay = self.limiter.bucket(private).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    async def synchronize(self) -> float:
+        import aiohttp
+
+        await self.throttle(private=False)
+        session = await self.open()
+        sent = time.time()
+        try:
+            async with session.get(self.route('/time')) as raw:
+                content = await raw.read()
+            received = time.time()
+            epoch = float(self.codec.loads(content)['epoch'])
+        except (aiohttp.ClientError, asyncio.TimeoutError,
+                KeyError, TypeError, ValueError):
+            return self.auth.clock.offset
+        return self.auth.clock.sync(epoch, sent, received)
+
+    def adapt(self, status: int) -> float:
+        return self.limiter.update(status, private=self.auth is not None)
+
+    def prepare(self,
+                method: str,
+                endpoint: str,
+                params: dict = None,
+                json: dict = None) -> tuple:
+
+        # NOTE:
+        #   - The url is encoded here so the signed path matches the sent one
+        #   - `None` values are dropped the same way `requests` drops them
+        path = endpoint
+        if params:
+            query = {k: v for k, v in params.items() if v is not None}
+            if query:
+                path = f'{endpoint}?{urllib.parse.urlencode(query, doseq=True)}'
+
+        url = self.route(path)
+        body = b'' if json is None else self.codec.dumps(json)
+        headers = {'Content-Type': 'application/json'}
+        if self.auth is not None:
+            parts = urllib.parse.urlsplit(url)
+            path_url = f'{parts.path}?{parts.query}' if parts.query else parts.path
+            signed = self.auth.sign(method, path_url, body.decode('utf-8'))
+            headers.update(signed)
+
+        return url, body, headers
+
+    async def send(self,
+                   method: str,
+                   endpoint: str,
+                   params: dict = None,
+                   json: dict = None) -> Response:
+
+        import aiohttp
+        import yarl
+
+        method = method.upper()
+        retry = method in cbpro.messenger.RETRY_METHODS
+        session = await self.open()
+        signed = self.auth is not None
+        if signed and self.auth.clock.due():
+            await self.synchronize()
+        attempt = 0
+        while True:
+            await self.throttle()
+            url, body, headers = self.prepare(method, endpoint, params, json)
+            try:
+                async with session.request(method,
+                                           yarl.URL(url, encoded=True),
+                                           data=body or None,
+                                           headers=headers) as raw:
+                    content = await raw.read()
+                    response = Response(raw.status, raw.headers, content)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not retry or attempt >= self.backoff.retries:
+                    raise
+                await asyncio.sleep(self.backoff.delay(attempt))
+                attempt += 1
+                continue
+
+            self.adapt(response.status_code)
+            if signed and cbpro.messenger.get_expired(response):
+                signed = False
+                await self.synchronize()
+                continue
+            if not retry or attempt >= self.backoff.retries:
+                return response
+            if response.status_code not in cbpro.messenger.RETRY_STATUS:
+                return response
+
+            after = cbpro.messenger.get_retry_after(response)
+            delay = self.backoff.delay(attempt) if after is None else min(self.backoff.cap, after)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, endpoint: str, params: dict = None) -> dict:
+        key = cbpro.cache.get_key(endpoint, params, cbpro.cache.get_identity(self.auth))
+        ttl = None if self.cache is None else self.cache.ttl(endpoint)
+        if ttl is not None:
+            hit, result = self.cache.get(key)
+            if hit:
+                return result
+
+        async def fetch() -> dict:
+            response = await self.send('GET', endpoint, params=params)
+            result = self.decode(response)
+            if ttl is not None and response.status_code == 200:
+                self.cache.set(key, result, ttl)
+            return result
+
+        if self.flights is None:
+            return await fetch()
+
+        # NOTE:
+        #   - Identical concurrent GETs await one shared task
+        #   - The task is shielded so one cancelled waiter cannot cancel it
+        #     for the others
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self.flights[key] = task
+            task.add_done_callback(lambda _: self.flights.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def post(self,
+                   endpoint: str,
+                   params: dict = None,
+                   json: dict = None) -> dict:
+
+        response = await self.send('POST', endpoint, params=params, json=json)
+        return self.decode(response)
+
+    async def delete(self, endpoint: str, **kwargs: dict) -> dict:
+        response = await self.send('DELETE', endpoint, **kwargs)
+        return self.decode(response)
+
+    async def request(self,
+                      method: str,
+                      endpoint: str,
+                      params: dict = None,
+                      json: dict = None) -> dict:
+
+        response = await self.send(method, endpoint, params=params, json=json)
+        return self.decode(response)
+
+    async def paginate(self, endpoint: str, params: dict = None) -> object:
+        # source: https://docs.pro.coinbase.com/?python#pagination
+        if params is None:
+            params = dict()
+        while True:
+            response = await self.send('GET', endpoint, params=params)
+            results = self.decode(response)
+            if response.status_code != 200:
+                raise cbpro.messenger.ResponseError(results)
+            for result in results:
+                yield result
+            after = response.headers.get('CB-AFTER')
+            before = params.get('before')
+            end = not after or before
+            if end:
+                break
+            params['after'] = response.headers['CB-AFTER']
+
+    async def batch(self,
+                    calls: list,
+                    workers: int = None,
+                    progress: object = None) -> list:
+
+        # NOTE:
+        #   - `calls` are zero argument callables returning awaitables
+        #   - `workers` bounds the number of requests in flight
+        #   - Results and exceptions are returned in input order
+        #   - `workers` below 1 sends the requests one by one
+        calls = list(calls)
+        semaphore = asyncio.Semaphore(64 if workers is None else max(1, workers))
+        done = 0
+
+        async def run(call: object) -> object:
+            nonlocal done
+            async with semaphore:
+                try:
+                    return await call()
+                finally:
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(calls))
+
+        return await asyncio.gather(
+            *(run(call) for call in calls), return_exceptions=True
+        )
+
+
+class AsyncHistory(cbpro.public.History):
+    async def fetch(self,
+                    plan: list,
+                    workers: int = None,
+                    progress: object = None) -> list:
+        """Send every (endpoint, params) request in plan concurrently, `workers` bounds how many are in flight."""
+        calls = [
+            functools.partial(self.messenger.get, endpoint, params=loop_params)
+            for endpoint, loop_params in plan
+        ]
+        return await self.messenger.batch(calls, workers, progress)
+
+    async def stream(self,
+                     product_id: str,
+                     params: dict = None,
+                     workers: int = None) -> object:
+        """Yield the candles of each interval in ascending time order as soon as they arrive.
+
+        Raises `ResponseError` with the error message if a request fails.
+        """
+        calls = iter([
+            functools.partial(self.messenger.get, endpoint, params=loop_params)
+            for endpoint, loop_params in self.plan(product_id, params)
+        ])
+
+        last = None
+        window = collections.deque()
+        try:
+            for call in itertools.islice(calls, workers or 1):
+                window.append(asyncio.ensure_future(call()))
+            while window:
+                response = await window.popleft()
+                for call in itertools.islice(calls, 1):
+                    window.append(asyncio.ensure_future(call()))
+                if not isinstance(response, list):
+                    raise cbpro.messenger.ResponseError(response)
+                chunk = self.chunk(response, last)
+                if chunk:
+                    last = chunk[-1][0]
+                    yield chunk
+        finally:
+            for task in window:
+                task.cancel()
+
+    async def candles(self,
+                      product_id: str,
+                      params: dict = None,
+                      workers: int = None,
+                      progress: object = None,
+                      columnar: bool = False) -> list:
+        """Get all candles for a given time frame from params.start to params.end."""
+        if self.store is None:
+            plan = self.plan(product_id, params)
+            return self.merge(await self.fetch(plan, workers, progress), columnar)
+
+        covered = self.store.covered(product_id, params["granularity"])
+        plan = self.plan(product_id, params, covered)
+        return self.save(product_id, params, plan, await self.fetch(plan, workers, progress), columnar)
+
+
+class AsyncBackfill(cbpro.public.Backfill):
+    async def collect(self, endpoint: str, params: dict) -> list:
+        """Get every trade of one planned chunk, following the cursor until the chunk is complete."""
+        trades = []
+        while params is not None:
+            response = await self.messenger.get(endpoint, params=params)
+            if not isinstance(response, list):
+                return response
+            trades.extend(response)
+            params = cbpro.public.get_next_page(params, response)
+        return trades
+
+    async def fetch(self,
+                    plan: list,
+                    workers: int = None,
+                    progress: object = None) -> list:
+        """Collect every planned chunk concurrently, `workers` bounds how many are in flight."""
+        calls = [
+            functools.partial(self.collect, endpoint, params)
+            for endpoint, params in plan
+        ]
+        return await self.messenger.batch(calls, workers, progress)
+
+    async def trades(self,
+                     product_id: str,
+                     first: int,
+                     last: int,
+                     workers: int = None,
+                     progress: object = None) -> list:
+        """Get all trades with a trade id from first to last, sorted by trade id ascending."""
+        responses = await self.fetch(self.plan(product_id, first, last), workers, progress)
+        return self.merge(responses, first, last)
+
+    async def latest(self, product_id: str) -> dict:
+        """Get the most recent trade, None if the product has no trades."""
+        response = await self.messenger.get(f"/products/{product_id}/trades", params={"limit": 1})
+        return cbpro.public.get_latest(response)
+
+    async def search(self, product_id: str, when: str, last: int = None) -> int:
+        """Get the id of the first trade at or after the ISO 8601 time `when`, by binary search over trade ids."""
+        endpoint = f"/products/{product_id}/trades"
+        when = parse_date(when)
+        if last is None:
+            trade = await self.latest(product_id)
+            if trade is None:
+                return None
+            last = trade["trade_id"]
+
+        lo, hi = 1, last + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            response = await self.messenger.get(endpoint, params={"after": mid + 1, "limit": 1})
+            lo, hi = cbpro.public.get_bisect(lo, hi, mid, response, when)
+
+        return lo
+
+    async def between(self,
+                      product_id: str,
+                      start: str,
+                      end: str,
+                      workers: int = None,
+                      progress: object = None) -> list:
+        """Get all trades from the ISO 8601 time start up to (excluding) end, sorted by trade id ascending."""
+        trade = await self.latest(product_id)
+        if trade is None:
+            return []
+        last = trade["trade_id"]
+        first = await self.search(product_id, start, last)
+        stop = await self.search(product_id, end, last)
+        if stop <= first:
+            return []
+        return await self.trades(product_id, first, stop - 1, workers, progress)
+
+
+class AsyncPublicClient(cbpro.public.PublicClient):
+    def __init__(self, messenger: AsyncMessenger) -> None:
+        super(AsyncPublicClient, self).__init__(messenger)
+        self.history = AsyncHistory(messenger)
+        self.backfill = AsyncBackfill(messenger)
+
+
+class AsyncPrivateClient(cbpro.private.PrivateClient):
+    def __init__(self, messenger: AsyncMessenger) -> None:
+        super(AsyncPrivateClient, self).__init__(messenger)
+        self.history = AsyncHistory(messenger)
+        self.backfill = AsyncBackfill(messenger)
+
+
+def async_public_client(url: str = None) -> AsyncPublicClient:
+    messenger = AsyncMessenger(url=url)
+    return AsyncPublicClient(messenger)
+
+
+def async_private_client(key: str,
+                         secret: str,
+                         passphrase: str,
+                         url: str = None) -> AsyncPrivateClient:
+
+    auth = cbpro.auth.Auth(key, secret, passphrase)
+    messenger = AsyncMessenger(auth=auth, url=url)
+    return AsyncPrivateClient(messenger)
@@ -14,6 +14,7 @@ from requests.models import PreparedRequest
 import base64
 import hmac
 import hashlib
+import threading
 import time
 
 
@@ -68,14 +69,74 @@ def get_headers(timestamp: str, b64signature: bytes, token: Token) -> dict:
     }
 
 
+class Signer(object):
+    def __init__(self, secret: str) -> None:
+        # NOTE: The key is decoded once and the keyed HMAC is reused
+        key = base64.b64decode(secret)
+        self.template = hmac.new(key, digestmod=hashlib.sha256)
+
+    def __call__(self, message: str) -> str:
+        sig = self.template.copy()
+        sig.update(message.encode('ascii'))
+        b64signature = base64.b64encode(sig.digest())
+        return b64signature.decode('utf-8')
+
+
+class Clock(object):
+    def __init__(self, interval: float = None) -> None:
+        # NOTE:
+        #   - `offset` is the server time minus the local time in seconds
+        #   - `interval` is how often, in seconds, the offset is resynced;
+        #     an interval of 0 disables syncing
+        self.offset = 0.0
+        self.interval = 300 if interval is None else interval
+        self.synced = None
+        self.lock = threading.Lock()
+
+    @property
+    def stale(self) -> bool:
+        if not self.interval:
+            return False
+        if self.synced is None:
+            return True
+        return time.monotonic() - self.synced >= self.interval
+
+    def due(self) -> bool:
+        # NOTE: Claims the next sync so only one caller performs it
+        with self.lock:
+            if not self.stale:
+                return False
+            self.synced = time.monotonic()
+            return True
+
+    def sync(self, epoch: float, sent: float, received: float) -> float:
+        # NOTE: Assume the server read its clock halfway through the request
+        self.offset = epoch - (sent + received) / 2
+        self.synced = time.monotonic()
+        return self.offset
+
+    def time(self) -> float:
+        return time.time() + self.offset
+
+    def timestamp(self) -> str:
+        return str(self.time())
+
+
 class Auth(AuthBase):
-    def __init__(self, key, secret, passphrase) -> None:
+    def __init__(self, key, secret, passphrase, clock: Clock = None) -> None:
         self.token = Token(key, secret, passphrase)
+        self.signer = Signer(secret)
+        self.clock = Clock() if clock is None else clock
 
     def __call__(self, request: PreparedRequest) -> PreparedRequest:
-        timestamp = get_timestamp()
-        message = get_message(timestamp, request)
-        b64signature = get_b64signature(message, self.token)
-        headers = get_headers(timestamp, b64signature, self.token)
+        body = get_request_body(request)
+        headers = self.sign(request.method, request.path_url, body)
         request.headers.update(headers)
         return request
+
+    def sign(self, method: str, path_url: str, body: str = '') -> dict:
+        # NOTE: Used directly by clients that do not build a PreparedRequest
+        timestamp = self.clock.timestamp()
+        message = f'{timestamp}{method}{path_url}{body}'
+        b64signature = self.signer(message)
+        return get_headers(timestamp, b64signature, self.token)
@@ -0,0 +1,184 @@
+#
+# Live OHLCV bars from the websocket `matches` channel
+#
+# NOTE:
+#   - Bars use the candle layout of the REST API:
+#     [time, low, high, open, close, volume]
+#   - Any granularity in seconds is supported, including sub-minute ones
+#   - Buckets without trades produce no bar, the same as the REST API
+#   - `heartbeat` messages arrive every second per product, so bars of
+#     quiet products close on time instead of on their next trade
+import collections
+import threading
+
+from iso8601 import parse_date
+
+import cbpro.websocket
+
+
+def get_time(value: str) -> float:
+    return parse_date(value).timestamp()
+
+
+def get_message(product_ids: list) -> dict:
+    return cbpro.websocket.get_message({
+        'type': 'subscribe',
+        'product_ids': list(product_ids),
+        'channels': ['matches', 'heartbeat']
+    })
+
+
+class BarBuilder(cbpro.websocket.WebsocketEvent):
+    def __init__(self,
+                 granularities: list = None,
+                 client: object = None,
+                 maxlen: int = None) -> None:
+
+        # NOTE:
+        #   - `client` is a `PublicClient` used to backfill the first
+        #     partial bar of every product from REST trades, on a worker
+        #     thread while that product's live trades are buffered
+        #   - `maxlen` closed bars are kept per product and granularity
+        self.granularities = sorted(set([60] if granularities is None else granularities))
+        self.client = client
+        self.maxlen = 1000 if maxlen is None else maxlen
+        self.bars = dict()
+        self.closed = dict()
+        self.last = dict()
+        self.pending = dict()
+        self.workers = dict()
+        self.lock = threading.Lock()
+
+    def on_response(self, value: dict) -> None:
+        if value.get('type') in ('match', 'last_match'):
+            self.on_match(value)
+        if 'time' in value:
+            # NOTE: Any timed message closes the due bars of every product
+            self.flush(get_time(value['time']))
+
+    def on_match(self, value: dict) -> None:
+        product_id = value['product_id']
+        with self.lock:
+            buffer = self.pending.get(product_id)
+            if buffer is not None:
+                buffer.append(value)
+                return
+            start = product_id not in self.last and self.client is not None
+            if start:
+                self.pending[product_id] = [value]
+        if not start:
+            self.update(product_id, value)
+            return
+        worker = threading.Thread(target=self.backfill, args=(product_id, value), daemon=True)
+        self.workers[product_id] = worker
+        worker.start()
+
+    def on_bar(self, product_id: str, granularity: int, candle: list) -> None:
+        # NOTE: Called once for every bar when it closes; override to consume bars
+        pass
+
+    def backfill(self, product_id: str, value: dict) -> None:
+        # NOTE:
+        #   - Replays the REST trades of the current bucket of every
+        #     granularity that precede the first websocket trade, then the
+        #     live trades buffered meanwhile
+        #   - Runs once per product, on a worker thread
+        first = value['trade_id']
+        when = get_time(value['time'])
+        start = min(when // g * g for g in self.granularities)
+
+        try:
+            trades = []
+            for trade in self.client.products.trades(product_id, params={'limit': 1000}):
+                if get_time(trade['time']) < start:
+                    break
+                if trade['trade_id'] < first:
+                    trades.append(trade)
+
+            for trade in reversed(trades):
+                self.update(product_id, trade)
+        except Exception as error:
+            self.on_error(str(error))
+        finally:
+            self.drain(product_id)
+
+    def drain(self, product_id: str) -> None:
+        # NOTE: Live trades go straight to `update` once the buffer is empty
+        while True:
+            with self.lock:
+                buffer = self.pending[product_id]
+                if not buffer:
+                    del self.pending[product_id]
+                    return
+                self.pending[product_id] = []
+            for trade in buffer:
+                self.update(product_id, trade)
+
+    def update(self, product_id: str, trade: dict) -> list:
+        trade_id = trade['trade_id']
+        when = get_time(trade['time'])
+        price = float(trade['price'])
+        size = float(trade['size'])
+
+        emitted = []
+        with self.lock:
+            if trade_id <= self.last.get(product_id, 0):
+                return emitted
+            self.last[product_id] = trade_id
+
+            for granularity in self.granularities:
+                key = (product_id, granularity)
+                bucket = int(when // granularity * granularity)
+                bar = self.bars.get(key)
+                closed = self.closed.get(key)
+                if bar is None and closed and bucket <= closed[-1][0]:
+                    # NOTE: Late trade for a bar that was already emitted
+                    continue
+                if bar is not None and bucket > bar[0]:
+                    emitted.append(self.close(key))
+                    bar = None
+                if bar is None:
+                    self.bars[key] = [bucket, price, price, price, price, size]
+                    continue
+                bar[1] = min(bar[1], price)
+                bar[2] = max(bar[2], price)
+                bar[4] = price
+                bar[5] += size
+
+        self.emit(emitted)
+        return emitted
+
+    def flush(self, now: float) -> list:
+        emitted = []
+        with self.lock:
+            for key, bar in list(self.bars.items()):
+                # NOTE: A bar being backfilled closes once its trades are in
+                if key[0] in self.pending:
+                    continue
+                if bar[0] + key[1] <= now:
+                    emitted.append(self.close(key))
+
+        self.emit(emitted)
+        return emitted
+
+    def close(self, key: tuple) -> tuple:
+        # NOTE: The caller holds the lock
+        bar = self.bars.pop(key)
+        closed = self.closed.get(key)
+        if closed is None:
+            closed = self.closed[key] = collections.deque(maxlen=self.maxlen)
+        closed.append(bar)
+        return key, bar
+
+    def emit(self, emitted: list) -> None:
+        for (product_id, granularity), bar in emitted:
+            self.on_bar(product_id, granularity, bar)
+
+    def current(self, product_id: str, granularity: int) -> list:
+        with self.lock:
+            bar = self.bars.get((product_id, granularity))
+            return None if bar is None else list(bar)
+
+    def history(self, product_id: str, granularity: int) -> list:
+        with self.lock:
+            return list(self.closed.get((product_id, granularity), ()))
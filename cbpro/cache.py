@@ -0,0 +1,156 @@
+import collections
+import re
+import threading
+import time
+
+
+def get_default_ttls() -> dict:
+    # NOTE:
+    #   - Values are in seconds
+    #   - `*` matches exactly one path segment
+    return {
+        '/products': 300,
+        '/products/*': 300,
+        '/currencies': 3600,
+        '/currencies/*': 3600,
+        '/fees': 60,
+        '/profiles': 300,
+        '/profiles/*': 300,
+        '/payment-methods': 300,
+        '/time': 1
+    }
+
+
+def get_pattern(endpoint: str) -> re.Pattern:
+    segments = [re.escape(s) for s in endpoint.split('*')]
+    return re.compile('[^/]+'.join(segments) + '$')
+
+
+def get_identity(auth: object) -> str:
+    # NOTE: The API key of an authenticated messenger, None when public
+    return None if auth is None else auth.token.key
+
+
+def get_key(endpoint: str, params: dict = None, identity: str = None) -> tuple:
+    # NOTE: Responses for different API keys never share a key, so one
+    # cache can safely back several authenticated messengers
+    items = () if not params else tuple(sorted(
+        (k, str(v)) for k, v in params.items() if v is not None
+    ))
+    if identity is None:
+        return (endpoint, items)
+    return (endpoint, items, identity)
+
+
+class Cache(object):
+    def __init__(self, ttls: dict = None, maxsize: int = None) -> None:
+        ttls = get_default_ttls() if ttls is None else ttls
+        self.patterns = [(get_pattern(e), ttl) for e, ttl in ttls.items()]
+        self.maxsize = 1024 if maxsize is None else maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries)
+        }
+
+    def ttl(self, endpoint: str) -> float:
+        for pattern, ttl in self.patterns:
+            if pattern.match(endpoint):
+                return ttl
+        return None
+
+    def get(self, key: tuple) -> tuple:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key: tuple, value: object, ttl: float) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, endpoint: str = None) -> int:
+        # NOTE: Drops `endpoint` and everything below it, or all entries
+        with self.lock:
+            if endpoint is None:
+                count = len(self.entries)
+                self.entries.clear()
+                return count
+            prefix = endpoint.rstrip('/') + '/'
+            keys = [
+                k for k in self.entries
+                if k[0] == endpoint or k[0].startswith(prefix)
+            ]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+class Flight(object):
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    def __init__(self) -> None:
+        self.flights = dict()
+        self.lock = threading.Lock()
+
+    def do(self, key: tuple, call: object) -> object:
+        # NOTE:
+        #   - The first caller for `key` runs `call`
+        #   - Concurrent callers with the same `key` wait for, and share,
+        #     its result or exception
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+        return flight.result
@@ -0,0 +1,67 @@
+#
+# JSON codecs shared by the REST and websocket clients
+#
+# NOTE:
+#   - `loads` accepts both `str` and `bytes`
+#   - `dumps` always returns UTF-8 encoded `bytes`
+#   - `orjson` and `ujson` are optional and used when installed
+import json
+
+
+class Codec(object):
+    name = 'json'
+
+    def loads(self, data: object) -> object:
+        return json.loads(data)
+
+    def dumps(self, value: object) -> bytes:
+        return json.dumps(value).encode('utf-8')
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        import orjson
+
+        self.orjson = orjson
+
+    def loads(self, data: object) -> object:
+        return self.orjson.loads(data)
+
+    def dumps(self, value: object) -> bytes:
+        return self.orjson.dumps(value)
+
+
+class UjsonCodec(Codec):
+    name = 'ujson'
+
+    def __init__(self) -> None:
+        import ujson
+
+        self.ujson = ujson
+
+    def loads(self, data: object) -> object:
+        return self.ujson.loads(data)
+
+    def dumps(self, value: object) -> bytes:
+        return self.ujson.dumps(value).encode('utf-8')
+
+
+codecs = {
+    'orjson': OrjsonCodec,
+    'ujson': UjsonCodec,
+    'json': Codec
+}
+
+
+def get_codec(name: str = None) -> Codec:
+    # NOTE: Without a `name`, pick the fastest codec that is installed
+    if name is not None:
+        return codecs[name]()
+
+    for codec in codecs.values():
+        try:
+            return codec()
+        except ImportError:
+            continue
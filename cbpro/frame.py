@@ -0,0 +1,85 @@
+#
+# Columnar candles on NumPy
+#
+# NOTE:
+#   - Requires `numpy`: pip install cbpro[numpy]
+#   - Candles are structured arrays sorted by time ascending with the
+#     fields of the API response: time, low, high, open, close, volume
+import numpy as np
+
+
+dtype = np.dtype([
+    ('time', np.int64),
+    ('low', np.float64),
+    ('high', np.float64),
+    ('open', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64)
+])
+
+
+def to_array(chunks: list) -> np.ndarray:
+    """Build one candle array from a list of candle lists (one per response).
+
+    Candles are sorted by time ascending and a time that appears in several chunks is kept once.
+    """
+    chunks = [np.asarray(chunk, dtype=np.float64).reshape(-1, 6) for chunk in chunks]
+    values = np.concatenate(chunks) if chunks else np.empty((0, 6))
+    times, index = np.unique(values[:, 0].astype(np.int64), return_index=True)
+
+    candles = np.empty(len(times), dtype=dtype)
+    candles['time'] = times
+    for column, name in enumerate(dtype.names[1:], 1):
+        candles[name] = values[index, column]
+    return candles
+
+
+def to_columns(candles: np.ndarray) -> dict:
+    """Get a dict of column arrays (views, not copies) from a candle array."""
+    return {name: candles[name] for name in dtype.names}
+
+
+def resample(candles: np.ndarray, granularity: int, origin: int = 0) -> np.ndarray:
+    """Aggregate candles into buckets of `granularity` seconds starting at `origin`.
+
+    The granularity may be any multiple of the source granularity, e.g. 60 -> 7200.
+    Buckets without candles are left out; see `fill_gaps`.
+    """
+    if not len(candles):
+        return np.empty(0, dtype=dtype)
+
+    buckets = (candles['time'] - origin) // granularity * granularity + origin
+    times, starts = np.unique(buckets, return_index=True)
+    ends = np.append(starts[1:], len(candles)) - 1
+
+    result = np.empty(len(times), dtype=dtype)
+    result['time'] = times
+    result['low'] = np.minimum.reduceat(candles['low'], starts)
+    result['high'] = np.maximum.reduceat(candles['high'], starts)
+    result['open'] = candles['open'][starts]
+    result['close'] = candles['close'][ends]
+    result['volume'] = np.add.reduceat(candles['volume'], starts)
+    return result
+
+
+def fill_gaps(candles: np.ndarray, granularity: int) -> np.ndarray:
+    """Insert a candle for every missing bucket between the first and last candle.
+
+    A filled candle carries the previous close as its open, high, low, and close, with zero volume.
+    """
+    if not len(candles):
+        return np.empty(0, dtype=dtype)
+
+    times = np.arange(candles['time'][0], candles['time'][-1] + 1, granularity)
+    # NOTE: index of the latest real candle at or before each bucket
+    index = np.searchsorted(candles['time'], times, side='right') - 1
+    present = candles['time'][index] == times
+
+    result = np.empty(len(times), dtype=dtype)
+    result['time'] = times
+    close = candles['close'][index]
+    for name in ('low', 'high', 'open'):
+        result[name] = np.where(present, candles[name][index], close)
+    result['close'] = close
+    result['volume'] = np.where(present, candles['volume'][index], 0.0)
+    return result
@@ -0,0 +1,112 @@
+#
+# source: https://docs.pro.coinbase.com/#rate-limits
+#
+# NOTE:
+#   - Public endpoints are throttled by IP: 3 requests per second,
+#     up to 6 requests per second in bursts.
+#   - Private endpoints are throttled by profile ID: 5 requests per second,
+#     up to 10 requests per second in bursts.
+import random
+import threading
+import time
+
+
+class TokenBucket(object):
+    def __init__(self,
+                 rate: float,
+                 capacity: float = None,
+                 floor: float = None) -> None:
+
+        self.rate = float(rate)
+        self.ceiling = self.rate
+        self.floor = self.rate / 10 if floor is None else float(floor)
+        self.capacity = self.rate if capacity is None else float(capacity)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.stamp)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.stamp = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        # NOTE:
+        #   - Tokens are taken immediately, even if that leaves a debt
+        #   - The debt is the caller's place in line: the returned delay is
+        #     how long it must wait before the reserved tokens are paid for
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def decrease(self, factor: float = 0.5) -> float:
+        # NOTE:
+        #   - Called when the exchange answers with a 429
+        #   - The rate is cut multiplicatively and the burst is forfeited
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = max(self.floor, self.rate * factor)
+            self.tokens = min(self.tokens, 0.0)
+            return self.rate
+
+    def increase(self, step: float = None) -> float:
+        # NOTE: Ramp back up additively, one step per accepted request
+        if step is None:
+            step = self.ceiling / 20
+        with self.lock:
+            if self.rate < self.ceiling:
+                self.refill(time.monotonic())
+                self.rate = min(self.ceiling, self.rate + step)
+            return self.rate
+
+
+class Limiter(object):
+    def __init__(self,
+                 public: TokenBucket = None,
+                 private: TokenBucket = None) -> None:
+
+        self.public = TokenBucket(3, 6) if public is None else public
+        self.private = TokenBucket(5, 10) if private is None else private
+
+    def bucket(self, private: bool = False) -> TokenBucket:
+        return self.private if private else self.public
+
+    def acquire(self, private: bool = False) -> float:
+        return self.bucket(private).acquire()
+
+    def update(self, status: int, private: bool = False) -> float:
+        bucket = self.bucket(private)
+        if status == 429:
+            return bucket.decrease()
+        if status < 400:
+            return bucket.increase()
+        return bucket.rate
+
+
+class Backoff(object):
+    def __init__(self,
+                 retries: int = 5,
+                 base: float = 0.5,
+                 cap: float = 30.0) -> None:
+
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int) -> float:
+        # source: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def wait(self, attempt: int, after: float = None) -> float:
+        delay = self.delay(attempt) if after is None else min(self.cap, after)
+        time.sleep(delay)
+        return delay
@@ -1,64 +1,311 @@
+import concurrent.futures
+import queue
 import requests
+import socket
+import threading
 import time
 
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
 import cbpro.auth
+import cbpro.cache
+import cbpro.codec
+import cbpro.limiter
+
+
+# NOTE:
+#   - 429 means the request was rate limited and never processed
+#   - 5xx means the exchange failed to answer
+#   - Only idempotent requests are retried automatically
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_METHODS = ('GET',)
+
+
+class ResponseError(Exception):
+    # NOTE: The API answered with an error message where data was expected
+    def __init__(self, response: object) -> None:
+        super(ResponseError, self).__init__(response)
+        self.response = response
+
+
+def get_expired(response: requests.Response) -> bool:
+    # NOTE: The signed timestamp was rejected; the request was not processed
+    status = response.status_code in (400, 401)
+    return status and b'timestamp' in response.content
+
+
+def get_retry_after(response: requests.Response) -> float:
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_socket_options(keepalive: bool = True, nodelay: bool = True) -> list:
+    options = [
+        o for o in HTTPConnection.default_socket_options
+        if o[:2] != (socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    ]
+    options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay)))
+    if keepalive:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        # NOTE: These are not available on every platform
+        for name, value in (('TCP_KEEPIDLE', 60),
+                            ('TCP_KEEPINTVL', 10),
+                            ('TCP_KEEPCNT', 6)):
+            if hasattr(socket, name):
+                options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class Adapter(HTTPAdapter):
+    def __init__(self, socket_options: list = None, **kwargs: dict) -> None:
+        self.socket_options = socket_options
+        super(Adapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        if self.socket_options is not None:
+            kwargs['socket_options'] = self.socket_options
+        super(Adapter, self).init_poolmanager(*args, **kwargs)
+
+
+class Pool(object):
+    def __init__(self,
+                 connections: int = None,
+                 maxsize: int = None,
+                 keepalive: bool = True,
+                 nodelay: bool = True,
+                 local: bool = False) -> None:
 
+        # NOTE:
+        #   - `connections` is the number of hosts to keep pools for
+        #   - `maxsize` is the number of connections kept per host
+        #   - `local` gives every thread its own session and pool; the
+        #     session of a finished thread is handed to the next thread
+        #     and at most `maxsize` idle sessions are kept
+        self.connections = 10 if connections is None else connections
+        self.maxsize = 10 if maxsize is None else maxsize
+        self.keepalive = keepalive
+        self.nodelay = nodelay
+        self.local = local
 
-__sleep__ = 0.275
+    def session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = Adapter(
+            socket_options=get_socket_options(self.keepalive, self.nodelay),
+            pool_connections=self.connections,
+            pool_maxsize=self.maxsize
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
 
 
 class Messenger(object):
     def __init__(self,
                  auth: cbpro.auth.Auth = None,
                  url: str = None,
-                 timeout: int = None) -> None:
+                 timeout: int = None,
+                 limiter: cbpro.limiter.Limiter = None,
+                 backoff: cbpro.limiter.Backoff = None,
+                 prefetch: int = None,
+                 cache: cbpro.cache.Cache = None,
+                 coalesce: bool = True,
+                 pool: Pool = None,
+                 warmup: bool = False,
+                 codec: cbpro.codec.Codec = None) -> None:
 
         api = 'https://api.pro.coinbase.com'
         self.auth = auth
         self.url = api if url is None else url.rstrip('/')
         self.timeout = 30 if timeout is None else timeout
-        self.session = requests.Session()
+        self.limiter = cbpro.limiter.Limiter() if limiter is None else limiter
+        self.backoff = cbpro.limiter.Backoff() if backoff is None else backoff
+        self.prefetch = 0 if prefetch is None else prefetch
+        self.cache = cache
+        self.flights = cbpro.cache.SingleFlight() if coalesce else None
+        self.codec = cbpro.codec.get_codec() if codec is None else codec
+        self.pool = Pool() if pool is None else pool
+        self.sessions = dict()
+        self.idle = []
+        self.executors = dict()
+        self.pooled = threading.local()
+        self.lock = threading.Lock()
+        self.__session = None if self.pool.local else self.pool.session()
+        if warmup:
+            self.warmup()
+
+    @property
+    def session(self) -> requests.Session:
+        if not self.pool.local:
+            return self.__session
+        thread = threading.current_thread()
+        session = self.sessions.get(thread)
+        if session is None:
+            session = self.checkout(thread)
+        return session
+
+    @session.setter
+    def session(self, value: requests.Session) -> None:
+        if self.pool.local:
+            with self.lock:
+                self.sessions[threading.current_thread()] = value
+        else:
+            self.__session = value
+
+    def checkout(self, thread: threading.Thread) -> requests.Session:
+        # NOTE: Reclaim the sessions of finished threads before opening one
+        with self.lock:
+            for other in [t for t in self.sessions if not t.is_alive()]:
+                self.idle.append(self.sessions.pop(other))
+            while len(self.idle) > self.pool.maxsize:
+                self.idle.pop(0).close()
+            session = self.idle.pop() if self.idle else self.pool.session()
+            self.sessions[thread] = session
+        return session
+
+    def warmup(self) -> bool:
+        # NOTE:
+        #   - Opens (and TLS handshakes) a pooled connection up front so
+        #     the first real request does not pay for it
+        #   - A warmed per-thread session goes to the first thread to need one
+        self.throttle()
+        session = self.pool.session() if self.pool.local else self.session
+        try:
+            session.head(self.url, timeout=self.timeout)
+        except requests.RequestException:
+            return False
+        finally:
+            if self.pool.local:
+                with self.lock:
+                    self.idle.append(session)
+        return True
+
+    def close(self) -> None:
+        # NOTE: Stops the batch workers and closes every session
+        with self.lock:
+            executors, self.executors = list(self.executors.values()), dict()
+            sessions = list(self.sessions.values()) + self.idle
+            self.sessions, self.idle = dict(), []
+        for executor in executors:
+            executor.shutdown(wait=True)
+        for session in sessions:
+            session.close()
+        if self.__session is not None:
+            self.__session.close()
 
     def route(self, endpoint: str) -> str:
         return f'{self.url}{endpoint}'
 
-    def get(self, endpoint: str, params: dict = None) -> dict:
-        time.sleep(__sleep__)
+    def decode(self, response: requests.Response) -> object:
+        # NOTE: Decode straight from the raw bytes; skips building a str
+        return self.codec.loads(response.content)
+
+    def throttle(self) -> float:
+        # NOTE: Authenticated requests count against the private limit
+        return self.limiter.acquire(private=self.auth is not None)
+
+    def synchronize(self) -> float:
+        # NOTE:
+        #   - Unauthenticated and uncached so signing never waits on itself
+        #   - A failed sync keeps the previous offset
+        self.limiter.acquire(private=False)
+        sent = time.time()
+        try:
+            response = self.session.get(
+                self.route('/time'), timeout=self.timeout
+            )
+            received = time.time()
+            epoch = float(self.decode(response)['epoch'])
+        except (requests.RequestException, KeyError, TypeError, ValueError):
+            return self.auth.clock.offset
+        return self.auth.clock.sync(epoch, sent, received)
+
+    def adapt(self, response: requests.Response) -> float:
+        status = response.status_code
+        return self.limiter.update(status, private=self.auth is not None)
+
+    def send(self,
+             method: str,
+             endpoint: str,
+             params: dict = None,
+             json: dict = None,
+             **kwargs: dict) -> requests.Response:
+
+        method = method.upper()
+        retry = method in RETRY_METHODS
         url = self.route(endpoint)
-        response = self.session.get(
-            url,
-            params=params,
-            auth=self.auth,
-            timeout=self.timeout
-        )
-        return response.json()
+        if json is not None:
+            kwargs['data'] = self.codec.dumps(json)
+            kwargs['headers'] = {'Content-Type': 'application/json'}
+        signed = self.auth is not None
+        if signed and self.auth.clock.due():
+            self.synchronize()
+        attempt = 0
+        while True:
+            self.throttle()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    auth=self.auth,
+                    timeout=self.timeout,
+                    **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if not retry or attempt >= self.backoff.retries:
+                    raise
+                self.backoff.wait(attempt)
+                attempt += 1
+                continue
+
+            self.adapt(response)
+            if signed and get_expired(response):
+                # NOTE: Resync the clock and resend once, for any method
+                signed = False
+                self.synchronize()
+                continue
+            if not retry or attempt >= self.backoff.retries:
+                return response
+            if response.status_code not in RETRY_STATUS:
+                return response
+
+            self.backoff.wait(attempt, get_retry_after(response))
+            attempt += 1
+
+    def get(self, endpoint: str, params: dict = None) -> dict:
+        # NOTE: Cached and coalesced results are shared; copy before mutating
+        key = cbpro.cache.get_key(endpoint, params, cbpro.cache.get_identity(self.auth))
+        ttl = None if self.cache is None else self.cache.ttl(endpoint)
+        if ttl is not None:
+            hit, result = self.cache.get(key)
+            if hit:
+                return result
+
+        def fetch() -> dict:
+            response = self.send('GET', endpoint, params=params)
+            result = self.decode(response)
+            if ttl is not None and response.status_code == 200:
+                self.cache.set(key, result, ttl)
+            return result
+
+        if self.flights is None:
+            return fetch()
+        return self.flights.do(key, fetch)
 
     def post(self,
              endpoint: str,
              params: dict = None,
              json: dict = None) -> dict:
 
-        time.sleep(__sleep__)
-        response = self.session.post(
-            url=self.route(endpoint),
-            params=params,
-            json=json,
-            auth=self.auth,
-            timeout=self.timeout
-        )
-
-        return response.json()
+        response = self.send('POST', endpoint, params=params, json=json)
+        return self.decode(response)
 
     def delete(self, endpoint: str, **kwargs: dict) -> dict:
-        time.sleep(__sleep__)
-        url = self.route(endpoint)
-        response = self.session.delete(
-            url,
-            auth=self.auth,
-            timeout=self.timeout,
-            **kwargs
-        )
-        return response.json()
+        response = self.send('DELETE', endpoint, **kwargs)
+        return self.decode(response)
 
     def request(self,
                 method: str,
@@ -66,36 +313,19 @@ class Messenger(object):
                 params: dict = None,
                 json: dict = None) -> dict:
 
-        time.sleep(__sleep__)
-        url = self.route(endpoint)
-        response = self.session.request(
-            method,
-            url,
-            json=json,
-            params=params,
-            auth=self.auth,
-            timeout=self.timeout
-        )
-        return response.json()
+        response = self.send(method, endpoint, params=params, json=json)
+        return self.decode(response)
 
-    def paginate(self, endpoint: str, params: dict = None) -> object:
+    def walk(self, endpoint: str, params: dict = None) -> object:
         # source: https://docs.pro.coinbase.com/?python#pagination
-        url = self.route(endpoint)
         if params is None:
             params = dict()
         while True:
-            time.sleep(__sleep__)
-            response = self.session.get(
-                url,
-                params=params,
-                auth=self.auth,
-                timeout=self.timeout
-            )
-            results = response.json()
+            response = self.send('GET', endpoint, params=params)
+            results = self.decode(response)
             if response.status_code != 200:
-                return results
-            for result in results:
-                yield result
+                raise ResponseError(results)
+            yield results
             after = response.headers.get('CB-AFTER')
             before = params.get('before')
             end = not after or before
@@ -103,6 +333,135 @@ class Messenger(object):
                 break
             params['after'] = response.headers['CB-AFTER']
 
+    def lookahead(self, endpoint: str, params: dict, depth: int) -> object:
+        # NOTE:
+        #   - A worker thread fetches the next page while the current one
+        #     is consumed; at most `depth` pages wait in the queue
+        #   - The worker stops as soon as the consumer closes the generator
+        pages = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+
+        def put(item: tuple) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def work() -> None:
+            walker = self.walk(endpoint, params)
+            try:
+                while True:
+                    try:
+                        page = next(walker)
+                    except StopIteration as done:
+                        put(('done', done.value))
+                        return
+                    if not put(('page', page)):
+                        return
+            except Exception as error:
+                put(('error', error))
+            finally:
+                walker.close()
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        try:
+            while True:
+                kind, value = pages.get()
+                if kind == 'page':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return value
+        finally:
+            stop.set()
+
+    def pages(self,
+              endpoint: str,
+              params: dict = None,
+              prefetch: int = None) -> object:
+
+        depth = self.prefetch if prefetch is None else prefetch
+        if depth < 1:
+            return (yield from self.walk(endpoint, params))
+
+        if params is None:
+            params = dict()
+        params.setdefault('limit', 100)
+        return (yield from self.lookahead(endpoint, params, depth))
+
+    def paginate(self,
+                 endpoint: str,
+                 params: dict = None,
+                 prefetch: int = None) -> object:
+
+        pages = self.pages(endpoint, params, prefetch)
+        while True:
+            try:
+                page = next(pages)
+            except StopIteration as done:
+                return done.value
+            yield from page
+
+    def batch(self,
+              calls: list,
+              workers: int = None,
+              progress: object = None) -> list:
+
+        # NOTE:
+        #   - `calls` are zero argument callables, e.g.
+        #     functools.partial(client.products.ticker, 'BTC-USD')
+        #   - Results are returned in input order
+        #   - A call that raised is returned as its exception instance
+        #   - `progress(done, total)` is called as each call completes
+        #   - Every request still draws from the shared rate limiter
+        #   - Worker threads are kept per `workers` count and reused by
+        #     later batches, so their sessions stay warm
+        #   - `workers` below 1 runs the calls one by one on this thread
+        #   - A batch started from inside a batch call also runs one by
+        #     one, since waiting on the pool from one of its own threads
+        #     can starve it of workers and deadlock
+        calls = list(calls)
+        if not calls:
+            return []
+        nested = getattr(self.pooled, 'active', False)
+        if nested or (workers is not None and workers < 1):
+            results = []
+            for call in calls:
+                try:
+                    results.append(call())
+                except Exception as error:
+                    results.append(error)
+                if progress is not None:
+                    progress(len(results), len(calls))
+            return results
+        executor = self.executor(8 if workers is None else workers)
+        futures = [executor.submit(call) for call in calls]
+        if progress is not None:
+            completed = concurrent.futures.as_completed(futures)
+            for done, _ in enumerate(completed, 1):
+                progress(done, len(futures))
+        return [
+            future.exception() or future.result()
+            for future in futures
+        ]
+
+    def executor(self, workers: int) -> concurrent.futures.ThreadPoolExecutor:
+        with self.lock:
+            executor = self.executors.get(workers)
+            if executor is None:
+                executor = self.executors[workers] = concurrent.futures.ThreadPoolExecutor(
+                    workers, initializer=self.enter)
+        return executor
+
+    def enter(self) -> None:
+        # NOTE: Marks a batch worker thread so nested batches run serially
+        self.pooled.active = True
+
 
 class Subscriber(object):
     def __init__(self, messenger: Messenger) -> None:
@@ -3,75 +3,546 @@
 # David Caseria
 #
 # Live order book updated from the Coinbase Websocket Feed
-
-from sortedcontainers import SortedDict
+#
+# NOTE:
+#   - `OrderBook` is a `WebsocketEvent`; run it with a `WebsocketClient`
+#     subscribed to the `full` channel of its product
+#   - Every order is indexed by id and every price level is a dict of
+#     orders in arrival (FIFO) order, so `done`, `change` and `match`
+#     messages take constant time however crowded the level is
+#   - Every level keeps the total size of its orders, so top of book,
+#     ladders, and cost to fill only read the levels they need
+#   - With `fixed`, prices and sizes are stored as integers scaled by the
+#     product's `quote_increment` and `base_increment`; getters still
+#     return `Decimal`
+#   - On a sequence gap the level 3 snapshot downloads on a background
+#     thread while live messages are buffered; once it arrives the buffered
+#     messages after the snapshot's sequence are replayed
+#   - `Level2Book` keeps aggregated price -> size levels from the `level2`
+#     channel when order level detail is not needed
+#   - `OrderBooks` keeps one book per product on a single connection
+#   - Books keep a bounded changelog of level sizes so readers can fetch
+#     only the levels that changed since a sequence; `get_arrays` exports
+#     the ladder to NumPy (pip install cbpro[numpy])
+#   - Queries are safe from any thread without locking the feed: the
+#     writer bumps a version around every message and a query is retried
+#     until no message was applied while it ran (a seqlock); a query that
+#     keeps losing to a busy feed briefly holds the next message back with
+#     a lock, but always runs on the reader's own thread
 from decimal import Decimal
+import abc
+import collections
+import concurrent.futures
+import functools
+import itertools
 import pickle
+import threading
+import time
+
+from sortedcontainers import SortedDict
+
+import cbpro.limiter
+import cbpro.public
+import cbpro.websocket
+
+from cbpro.utils import get_decimal
+from cbpro.utils import get_fixed
+from cbpro.utils import get_places
+
+
+class Scale(object):
+    # NOTE: Prices and sizes are stored as `Decimal`
+    price_factor = 1
+    size_factor = 1
 
-from cbpro.public_client import PublicClient
-from cbpro.websocket_client import WebsocketClient
+    def price(self, value: object) -> Decimal:
+        return Decimal(value)
+
+    def size(self, value: object) -> Decimal:
+        return Decimal(value)
+
+    def floor_size(self, value: object) -> Decimal:
+        return Decimal(value)
+
+    def to_price(self, value: Decimal) -> Decimal:
+        return value
+
+    def to_size(self, value: Decimal) -> Decimal:
+        # NOTE: Removed levels are logged with an `int` 0
+        return Decimal(value)
+
+    def to_cost(self, value: Decimal) -> Decimal:
+        return value
+
+
+class FixedScale(Scale):
+    # NOTE: Prices and sizes are stored as scaled `int`
+    def __init__(self, quote_increment: str, base_increment: str) -> None:
+        # NOTE: Values that are not a multiple of the increment raise ValueError
+        self.price_places = get_places(quote_increment)
+        self.size_places = get_places(base_increment)
+        self.price_step = get_fixed(quote_increment, self.price_places)
+        self.size_step = get_fixed(base_increment, self.size_places)
+        self.price_factor = 10 ** self.price_places
+        self.size_factor = 10 ** self.size_places
+
+    @classmethod
+    def from_product(cls, product: dict) -> 'FixedScale':
+        return cls(product['quote_increment'], product['base_increment'])
+
+    def price(self, value: object) -> int:
+        return get_fixed(value, self.price_places, self.price_step)
+
+    def size(self, value: object) -> int:
+        return get_fixed(value, self.size_places, self.size_step)
+
+    def floor_size(self, value: object) -> int:
+        # NOTE: Rounds down to the increment instead of raising
+        fixed = int(get_decimal(value).scaleb(self.size_places))
+        return fixed - fixed % self.size_step
+
+    def to_price(self, value: int) -> Decimal:
+        return Decimal(value).scaleb(-self.price_places)
+
+    def to_size(self, value: int) -> Decimal:
+        return Decimal(value).scaleb(-self.size_places)
+
+    def to_cost(self, value: int) -> Decimal:
+        return Decimal(value).scaleb(-self.price_places - self.size_places)
+
+
+class Level(dict):
+    # NOTE: Orders by id in FIFO order and their total size
+    __slots__ = ('size',)
+
+    def __init__(self) -> None:
+        super(Level, self).__init__()
+        self.size = 0
+
+
+def consistent(method: object) -> object:
+    # NOTE: Run a query through `Book.read`
+    @functools.wraps(method)
+    def query(self, *args, **kwargs) -> object:
+        return self.read(functools.partial(method, self, *args, **kwargs))
+
+    return query
+
+
+class Book(cbpro.websocket.WebsocketEvent, abc.ABC):
+    # NOTE:
+    #   - Queries shared by the level 2 and level 3 books
+    #   - Subclasses keep `_bids` and `_asks` as price -> level
+    #     `SortedDict`s and implement `size` and `count` for a level
+    #   - Subclasses apply every message between `begin` and `end`
+    def __init__(self, changelog: int = None, attempts: int = None) -> None:
+        # NOTE:
+        #   - Keep the last `changelog` level changes for `get_changes`
+        #   - A read is retried `attempts` times, backing off, before it
+        #     takes `_lock` and holds the next message back while it runs
+        self._changes = collections.deque(maxlen=10000 if changelog is None else changelog)
+        self._floor = -1
+        self._version = 0
+        self._writer = None
+        self._lock = threading.Lock()
+        self._readers = threading.Lock()
+        self._waiting = False
+        self._reading = threading.local()
+        self._backoff = cbpro.limiter.Backoff(
+            retries=3 if attempts is None else attempts, base=0.0005, cap=0.01
+        )
+
+    def begin(self) -> bool:
+        # NOTE:
+        #   - An odd version means a message is being applied
+        #   - The lock is only taken while a reader is waiting for it
+        self._writer = threading.get_ident()
+        locked = self._waiting
+        if locked:
+            self._lock.acquire()
+        self._version += 1
+        return locked
+
+    def end(self, locked: bool) -> None:
+        self._version += 1
+        if locked:
+            self._lock.release()
+
+    def attempt(self, call: object) -> tuple:
+        # NOTE: [done, result] of one optimistic run of `call`
+        version = self._version
+        if version % 2:
+            return False, None
+        self._reading.active = True
+        try:
+            result = call()
+        except Exception:
+            # NOTE: The book changed underneath the query
+            if self._version == version:
+                raise
+            return False, None
+        finally:
+            self._reading.active = False
+        return self._version == version, result
+
+    def read(self, call: object) -> object:
+        # NOTE:
+        #   - Returns `call()` as of one sequence, never a half-applied message
+        #   - Wrap several queries in one `read` to get them from the same sequence
+        #   - `call` always runs on the calling thread
+        #   - Queries nested in a read run directly; the outer version
+        #     check covers them
+        if self._writer == threading.get_ident() or getattr(self._reading, 'active', False):
+            return call()
+
+        for attempt in range(self._backoff.retries):
+            done, result = self.attempt(call)
+            if done:
+                return result
+            self._backoff.wait(attempt)
+
+        # NOTE: Hold the next message back; at most the one in flight finishes
+        with self._readers:
+            self._waiting = True
+            try:
+                with self._lock:
+                    while True:
+                        done, result = self.attempt(call)
+                        if done:
+                            return result
+                        time.sleep(0)
+            finally:
+                self._waiting = False
+
+    def log(self, side: str, price: object) -> None:
+        # NOTE: Record the new total size of a level, 0 once it is gone
+        tree = self._bids if side == 'buy' else self._asks
+        level = tree.get(price)
+        size = 0 if level is None else self.size(level)
+        self._changes.append((self._sequence, side, price, size))
+
+    def rebase(self) -> None:
+        # NOTE: A new snapshot; earlier changes no longer apply
+        self._changes.clear()
+        self._floor = self._sequence
+
+    @abc.abstractmethod
+    def size(self, level: object) -> object:
+        # NOTE: The total size of a price level
+        pass
+
+    @abc.abstractmethod
+    def count(self, level: object) -> int:
+        # NOTE: The number of orders at a price level, None if unknown
+        pass
+
+    def side(self, side: str) -> object:
+        # NOTE: Price levels from the best price outward
+        if side == 'buy':
+            return ((price, self._bids[price]) for price in reversed(self._bids))
+        return iter(self._asks.items())
+
+    @consistent
+    def get_ask(self) -> Decimal:
+        return self._scale.to_price(self._asks.peekitem(0)[0])
+
+    @consistent
+    def get_bid(self) -> Decimal:
+        return self._scale.to_price(self._bids.peekitem(-1)[0])
+
+    @consistent
+    def get_best_ask(self) -> list:
+        if not self._asks:
+            return None
+        price, level = self._asks.peekitem(0)
+        return [self._scale.to_price(price), self._scale.to_size(self.size(level))]
+
+    @consistent
+    def get_best_bid(self) -> list:
+        if not self._bids:
+            return None
+        price, level = self._bids.peekitem(-1)
+        return [self._scale.to_price(price), self._scale.to_size(self.size(level))]
+
+    @consistent
+    def get_spread(self) -> Decimal:
+        if not self._bids or not self._asks:
+            return None
+        return self._scale.to_price(self._asks.peekitem(0)[0] - self._bids.peekitem(-1)[0])
+
+    @consistent
+    def get_ladder(self, depth: int = None) -> dict:
+        # NOTE: [price, size, count] of the best `depth` levels per side
+        result = {'sequence': self._sequence}
+        for side, name in (('buy', 'bids'), ('sell', 'asks')):
+            levels = itertools.islice(self.side(side), depth)
+            result[name] = [
+                [self._scale.to_price(price),
+                 self._scale.to_size(self.size(level)),
+                 self.count(level)]
+                for price, level in levels
+            ]
+        return result
 
+    @consistent
+    def get_cost(self, side: str, size: object) -> list:
+        # NOTE:
+        #   - [filled, cost] of a market order of `size` on `side`
+        #   - A buy takes the asks and a sell takes the bids
+        #   - `filled` is less than `size` when the book is too thin
+        #   - On a fixed book `size` is rounded down to the base increment
+        remaining = self._scale.floor_size(size)
+        filled = 0
+        cost = 0
+        for price, level in self.side('sell' if side == 'buy' else 'buy'):
+            if remaining <= 0:
+                break
+            take = min(remaining, self.size(level))
+            filled += take
+            cost += take * price
+            remaining -= take
+        return [self._scale.to_size(filled), self._scale.to_cost(cost)]
+
+    def get_vwap(self, side: str, size: object) -> Decimal:
+        filled, cost = self.get_cost(side, size)
+        if not filled:
+            return None
+        return cost / filled
+
+    @consistent
+    def get_changes(self, since: int) -> dict:
+        # NOTE:
+        #   - The latest [price, size] of every level that changed after
+        #     sequence `since`; a size of 0 means the level is gone
+        #   - `None` when the changelog no longer reaches back to `since`
+        #     (or a snapshot was loaded since); read the full book instead
+        changes = list(self._changes)
+        floor = self._floor
+        if changes and len(changes) == self._changes.maxlen:
+            floor = max(floor, changes[0][0])
+        if since < floor:
+            return None
+
+        latest = dict()
+        for sequence, side, price, size in reversed(changes):
+            if sequence <= since:
+                break
+            latest.setdefault((side, price), size)
+
+        result = {'sequence': self._sequence, 'bids': [], 'asks': []}
+        for (side, price), size in latest.items():
+            result['bids' if side == 'buy' else 'asks'].append(
+                [self._scale.to_price(price), self._scale.to_size(size)]
+            )
+        return result
 
-class OrderBook(WebsocketClient):
-    def __init__(self, product_id='BTC-USD', log_to=None):
-        super(OrderBook, self).__init__(
-            products=product_id, channels=['full'])
+    @consistent
+    def get_arrays(self, depth: int = None, out: dict = None) -> dict:
+        # NOTE:
+        #   - The best `depth` levels per side as float64 arrays named
+        #     `bid_price`, `bid_size`, `bid_count`, `ask_price`, ...
+        #   - Pass the result of a previous call as `out` to fill its
+        #     arrays in place instead of allocating new ones
+        #   - Rows past the end of the book (and level 2 counts) are NaN
+        import numpy as np
+
+        if out is not None:
+            depth = len(out['bid_price'])
+        else:
+            if depth is None:
+                depth = max(len(self._bids), len(self._asks))
+            names = [f'{p}_{f}' for p in ('bid', 'ask') for f in ('price', 'size', 'count')]
+            out = {name: np.empty(depth) for name in names}
+
+        out['sequence'] = self._sequence
+        for side, prefix in (('buy', 'bid'), ('sell', 'ask')):
+            prices = out[f'{prefix}_price']
+            sizes = out[f'{prefix}_size']
+            counts = out[f'{prefix}_count']
+            n = 0
+            for price, level in itertools.islice(self.side(side), depth):
+                count = self.count(level)
+                prices[n] = price
+                sizes[n] = self.size(level)
+                counts[n] = np.nan if count is None else count
+                n += 1
+            prices[:n] /= self._scale.price_factor
+            sizes[:n] /= self._scale.size_factor
+            for array in (prices, sizes, counts):
+                array[n:] = np.nan
+        return out
+
+
+class OrderBook(Book):
+    def __init__(self,
+                 product_id: str = 'BTC-USD',
+                 client: cbpro.public.PublicClient = None,
+                 log_to: object = None,
+                 fixed: bool = False,
+                 executor: concurrent.futures.Executor = None,
+                 changelog: int = None,
+                 product: dict = None,
+                 backoff: cbpro.limiter.Backoff = None,
+                 maxbuffer: int = None) -> None:
+
+        # NOTE:
+        #   - Snapshots download on `executor` when given, else on a
+        #     short-lived thread per resync
+        #   - A failed snapshot is retried after a `backoff` delay
+        #   - Past `maxbuffer` messages the snapshot in flight is stale; the
+        #     buffer is dropped and another snapshot is taken
+        #   - With `fixed`, the increments come from `product` (a
+        #     `Products.get` response) or are requested with the first
+        #     snapshot, off the receive thread
+        super(OrderBook, self).__init__(changelog)
+        self.product_id = product_id
+        self.fixed = fixed
         self._asks = SortedDict()
         self._bids = SortedDict()
-        self._client = PublicClient()
+        self._orders = dict()
+        self._client = cbpro.public.public_client() if client is None else client
         self._sequence = -1
         self._log_to = log_to
         if self._log_to:
             assert hasattr(self._log_to, 'write')
         self._current_ticker = None
-
-    @property
-    def product_id(self):
-        ''' Currently OrderBook only supports a single product even though it is stored as a list of products. '''
-        return self.products[0]
-
-    def on_open(self):
+        self._scale = None if fixed else Scale()
+        if fixed and product is not None:
+            self._scale = FixedScale.from_product(product)
+        self._buffer = None
+        self._snapshot = None
+        self._ready = threading.Event()
+        self._executor = executor
+        self._retry = cbpro.limiter.Backoff() if backoff is None else backoff
+        self._attempt = 0
+        self._overflow = False
+        self.maxbuffer = 100000 if maxbuffer is None else maxbuffer
+
+    def get_message(self) -> dict:
+        return cbpro.websocket.get_message({
+            'type': 'subscribe',
+            'product_ids': [self.product_id],
+            'channels': ['full']
+        })
+
+    def on_start(self) -> None:
         self._sequence = -1
-        print("-- Subscribed to OrderBook! --\n")
 
-    def on_close(self):
-        print("\n-- OrderBook Socket Closed! --")
+    def on_response(self, value: dict) -> None:
+        self.on_message(value)
 
-    def reset_book(self):
-        self._asks = SortedDict()
-        self._bids = SortedDict()
-        res = self._client.get_product_order_book(product_id=self.product_id, level=3)
+    def snapshot(self) -> tuple:
+        # NOTE: Downloads and builds a book without touching the live one
+        if self._scale is None:
+            product = self._client.products.get(self.product_id)
+            self._scale = FixedScale.from_product(product)
+        bids, asks, orders = SortedDict(), SortedDict(), dict()
+        res = self._client.products.order_book(self.product_id, {'level': 3})
         for bid in res['bids']:
-            self.add({
+            self.insert({
                 'id': bid[2],
                 'side': 'buy',
-                'price': Decimal(bid[0]),
-                'size': Decimal(bid[1])
-            })
+                'price': bid[0],
+                'size': bid[1]
+            }, bids, asks, orders)
         for ask in res['asks']:
-            self.add({
+            self.insert({
                 'id': ask[2],
                 'side': 'sell',
-                'price': Decimal(ask[0]),
-                'size': Decimal(ask[1])
-            })
-        self._sequence = res['sequence']
+                'price': ask[0],
+                'size': ask[1]
+            }, bids, asks, orders)
+        return res['sequence'], bids, asks, orders
+
+    def reset_book(self) -> None:
+        snapshot = self.snapshot()
+        locked = self.begin()
+        try:
+            self._sequence, self._bids, self._asks, self._orders = snapshot
+            self.rebase()
+        finally:
+            self.end(locked)
+
+    def resync(self) -> None:
+        # NOTE: Start buffering and download the snapshot off the receive thread
+        self._buffer = collections.deque()
+        self._snapshot = None
+        self._overflow = False
+        self._ready.clear()
+        if self._executor is not None:
+            self._executor.submit(self.download)
+        else:
+            threading.Thread(target=self.download, daemon=True).start()
 
-    def on_message(self, message):
+    def download(self) -> None:
+        # NOTE: Runs off the receive thread, so waiting here is harmless
+        if self._attempt:
+            self._retry.wait(self._attempt - 1)
+        try:
+            self._snapshot = self.snapshot()
+        except Exception as error:
+            self._snapshot = error
+        finally:
+            self._ready.set()
+
+    def replay(self) -> None:
+        snapshot, buffer, overflow = self._snapshot, self._buffer, self._overflow
+        self._buffer = None
+        if isinstance(snapshot, Exception) or overflow:
+            if not overflow:
+                self.on_error(str(snapshot))
+                self._attempt += 1
+            self.resync()
+            self._buffer.extend(buffer)
+            return
+        self._attempt = 0
+        self._sequence, self._bids, self._asks, self._orders = snapshot
+        self.rebase()
+        for message in buffer:
+            if self._buffer is not None:
+                # NOTE: Another gap while replaying; keep buffering for the next snapshot
+                self.hold(message)
+            else:
+                self.process(message)
+
+    def hold(self, message: dict) -> None:
+        if len(self._buffer) >= self.maxbuffer:
+            # NOTE: The messages after the snapshot in flight are lost
+            self._buffer.clear()
+            self._overflow = True
+        self._buffer.append(message)
+
+    def on_message(self, message: dict) -> None:
         if self._log_to:
             pickle.dump(message, self._log_to)
 
+        locked = self.begin()
+        try:
+            if self._buffer is not None:
+                self.hold(message)
+                if self._ready.is_set():
+                    self.replay()
+                return
+            self.process(message)
+        finally:
+            self.end(locked)
+
+    def process(self, message: dict) -> None:
         sequence = message.get('sequence', -1)
         if self._sequence == -1:
-            self.reset_book()
+            self.resync()
+            self.hold(message)
             return
         if sequence <= self._sequence:
             # ignore older messages (e.g. before order book initialization from getProductOrderBook)
             return
         elif sequence > self._sequence + 1:
             self.on_sequence_gap(self._sequence, sequence)
+            if self._buffer is not None:
+                self.hold(message)
             return
 
+        self._sequence = sequence
         msg_type = message['type']
         if msg_type == 'open':
             self.add(message)
@@ -83,172 +554,306 @@ class OrderBook(WebsocketClient):
         elif msg_type == 'change':
             self.change(message)
 
-        self._sequence = sequence
-
-    def on_sequence_gap(self, gap_start, gap_end):
-        self.reset_book()
-        print('Error: messages missing ({} - {}). Re-initializing  book at sequence.'.format(
-            gap_start, gap_end, self._sequence))
+    def on_sequence_gap(self, gap_start: int, gap_end: int) -> None:
+        self.resync()
+        print(f'Error: messages missing ({gap_start} - {gap_end}). '
+              f'Re-synchronizing book from a snapshot.')
 
+    def add(self, order: dict) -> None:
+        order = self.insert(order, self._bids, self._asks, self._orders)
+        self.log(order['side'], order['price'])
 
-    def add(self, order):
+    def insert(self, order: dict, bids: SortedDict, asks: SortedDict, orders: dict) -> dict:
         order = {
             'id': order.get('order_id') or order['id'],
             'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
+            'price': self._scale.price(order['price']),
+            'size': self._scale.size(order.get('size') or order['remaining_size'])
         }
-        if order['side'] == 'buy':
-            bids = self.get_bids(order['price'])
-            if bids is None:
-                bids = [order]
-            else:
-                bids.append(order)
-            self.set_bids(order['price'], bids)
-        else:
-            asks = self.get_asks(order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(order['price'], asks)
-
-    def remove(self, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(price, bids)
-                else:
-                    self.remove_bids(price)
-        else:
-            asks = self.get_asks(price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(price, asks)
-                else:
-                    self.remove_asks(price)
-
-    def match(self, order):
-        size = Decimal(order['size'])
-        price = Decimal(order['price'])
-
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(price, bids)
+        tree = bids if order['side'] == 'buy' else asks
+        level = tree.get(order['price'])
+        if level is None:
+            level = tree[order['price']] = Level()
+        level[order['id']] = order
+        level.size += order['size']
+        orders[order['id']] = order
+        return order
+
+    def remove(self, order: dict) -> None:
+        order = self._orders.pop(order['order_id'], None)
+        if order is None:
+            return
+        tree = self._bids if order['side'] == 'buy' else self._asks
+        level = tree[order['price']]
+        del level[order['id']]
+        level.size -= order['size']
+        if not level:
+            del tree[order['price']]
+        self.log(order['side'], order['price'])
+
+    def match(self, order: dict) -> None:
+        maker = self._orders.get(order['maker_order_id'])
+        if maker is None:
+            return
+        size = self._scale.size(order['size'])
+        maker['size'] -= size
+        self.level(maker).size -= size
+        if maker['size'] <= 0:
+            self.remove({'order_id': maker['id']})
         else:
-            asks = self.get_asks(price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(price, asks[1:])
-            else:
-                asks[0]['size'] -= size
-                self.set_asks(price, asks)
+            self.log(maker['side'], maker['price'])
 
-    def change(self, order):
-        try:
-            new_size = Decimal(order['new_size'])
-        except KeyError:
+    def change(self, order: dict) -> None:
+        # NOTE: Market orders change `new_funds` instead of `new_size`
+        if 'new_size' not in order:
             return
-
-        try:
-            price = Decimal(order['price'])
-        except KeyError:
+        resting = self._orders.get(order['order_id'])
+        if resting is None:
             return
+        size = self._scale.size(order['new_size'])
+        self.level(resting).size += size - resting['size']
+        resting['size'] = size
+        self.log(resting['side'], resting['price'])
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(price, bids)
-        else:
-            asks = self.get_asks(price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(price, asks)
+    def level(self, order: dict) -> Level:
+        tree = self._bids if order['side'] == 'buy' else self._asks
+        return tree[order['price']]
 
-        tree = self._asks if order['side'] == 'sell' else self._bids
-        node = tree.get(price)
+    def size(self, level: Level) -> object:
+        return level.size
 
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
-            return
+    def count(self, level: Level) -> int:
+        return len(level)
 
-    def get_current_ticker(self):
+    def get_current_ticker(self) -> dict:
         return self._current_ticker
 
-    def get_current_book(self):
+    @consistent
+    def get_current_book(self) -> dict:
         result = {
             'sequence': self._sequence,
             'asks': [],
             'bids': [],
         }
-        for ask in self._asks:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_ask = self._asks[ask]
-            except KeyError:
-                continue
-            for order in this_ask:
+        for level in self._asks.values():
+            for order in level.values():
+                order = self.export(order)
                 result['asks'].append([order['price'], order['size'], order['id']])
-        for bid in self._bids:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_bid = self._bids[bid]
-            except KeyError:
-                continue
-
-            for order in this_bid:
+        for level in self._bids.values():
+            for order in level.values():
+                order = self.export(order)
                 result['bids'].append([order['price'], order['size'], order['id']])
         return result
 
-    def get_ask(self):
-        return self._asks.peekitem(0)[0]
+    def export(self, order: dict) -> dict:
+        # NOTE: A copy with `Decimal` price and size
+        return {
+            'id': order['id'],
+            'side': order['side'],
+            'price': self._scale.to_price(order['price']),
+            'size': self._scale.to_size(order['size'])
+        }
 
-    def get_asks(self, price):
-        return self._asks.get(price)
+    @consistent
+    def get_order(self, order_id: str) -> dict:
+        order = self._orders.get(order_id)
+        return None if order is None else self.export(order)
 
-    def remove_asks(self, price):
-        del self._asks[price]
+    @consistent
+    def get_asks(self, price: Decimal) -> list:
+        try:
+            level = self._asks.get(self._scale.price(price))
+        except ValueError:
+            # NOTE: A price off the tick cannot have a level
+            return None
+        return None if level is None else [self.export(o) for o in level.values()]
+
+    @consistent
+    def get_bids(self, price: Decimal) -> list:
+        try:
+            level = self._bids.get(self._scale.price(price))
+        except ValueError:
+            # NOTE: A price off the tick cannot have a level
+            return None
+        return None if level is None else [self.export(o) for o in level.values()]
+
+
+class Level2Book(Book):
+    def __init__(self,
+                 product_id: str = 'BTC-USD',
+                 client: cbpro.public.PublicClient = None,
+                 fixed: bool = False,
+                 changelog: int = None,
+                 product: dict = None) -> None:
+
+        # NOTE:
+        #   - The feed sends a full `snapshot` on subscribe, so no REST
+        #     request is needed unless `fixed` loads the increments
+        #   - With `fixed`, the increments come from `product` (a
+        #     `Products.get` response) or are requested here, before the
+        #     feed starts, never on the receive thread
+        #   - The level2 channel has no sequence numbers; `_sequence`
+        #     counts snapshots and updates and never goes back, so a
+        #     sequence read before a snapshot is older than the snapshot
+        super(Level2Book, self).__init__(changelog)
+        self.product_id = product_id
+        self.fixed = fixed
+        self._asks = SortedDict()
+        self._bids = SortedDict()
+        self._client = client
+        self._sequence = -1
+        self._synced = False
+        if fixed and product is None:
+            client = cbpro.public.public_client() if client is None else client
+            product = client.products.get(product_id)
+        self._scale = FixedScale.from_product(product) if fixed else Scale()
+
+    def get_message(self) -> dict:
+        return cbpro.websocket.get_message({
+            'type': 'subscribe',
+            'product_ids': [self.product_id],
+            'channels': ['level2']
+        })
+
+    def on_start(self) -> None:
+        # NOTE: Updates are ignored until the snapshot of the new subscription
+        self._synced = False
+
+    def on_response(self, value: dict) -> None:
+        self.on_message(value)
+
+    def on_message(self, message: dict) -> None:
+        msg_type = message.get('type')
+        if msg_type == 'snapshot':
+            self.load(message)
+        elif msg_type == 'l2update' and self._synced:
+            locked = self.begin()
+            try:
+                self._sequence += 1
+                for side, price, size in message['changes']:
+                    self.update(side, price, size)
+            finally:
+                self.end(locked)
+
+    def load(self, snapshot: dict) -> None:
+        price, size = self._scale.price, self._scale.size
+        bids = SortedDict((price(p), size(s)) for p, s in snapshot['bids'])
+        asks = SortedDict((price(p), size(s)) for p, s in snapshot['asks'])
+        locked = self.begin()
+        try:
+            self._bids, self._asks = bids, asks
+            self._sequence += 1
+            self._synced = True
+            self.rebase()
+        finally:
+            self.end(locked)
+
+    def update(self, side: str, price: str, size: str) -> None:
+        tree = self._bids if side == 'buy' else self._asks
+        price = self._scale.price(price)
+        size = self._scale.size(size)
+        if size:
+            tree[price] = size
+        else:
+            tree.pop(price, None)
+        self.log(side, price)
 
-    def set_asks(self, price, asks):
-        self._asks[price] = asks
+    def size(self, level: object) -> object:
+        return level
 
-    def get_bid(self):
-        return self._bids.peekitem(-1)[0]
+    def count(self, level: object) -> int:
+        # NOTE: Order counts are not part of the level2 channel
+        return None
 
-    def get_bids(self, price):
-        return self._bids.get(price)
+    @consistent
+    def get_current_book(self) -> dict:
+        to_price, to_size = self._scale.to_price, self._scale.to_size
+        return {
+            'sequence': self._sequence,
+            'asks': [[to_price(p), to_size(s)] for p, s in self._asks.items()],
+            'bids': [[to_price(p), to_size(s)] for p, s in self._bids.items()]
+        }
 
-    def remove_bids(self, price):
-        del self._bids[price]
 
-    def set_bids(self, price, bids):
-        self._bids[price] = bids
+class OrderBooks(cbpro.websocket.WebsocketEvent):
+    def __init__(self,
+                 product_ids: list,
+                 client: cbpro.public.PublicClient = None,
+                 fixed: bool = False,
+                 workers: int = None,
+                 level: int = 3) -> None:
+
+        # NOTE:
+        #   - Messages are routed to their book by `product_id`
+        #   - `level` 3 keeps `OrderBook`s on the `full` channel and
+        #     `level` 2 keeps `Level2Book`s on the `level2` channel
+        #   - Every level 3 book resyncs on its own; snapshots share a pool
+        #     of `workers` threads instead of a thread per product
+        #   - With `fixed`, the increments of every product are loaded up
+        #     front with a single request
+        client = cbpro.public.public_client() if client is None else client
+        self.level = level
+        self.workers = 4 if workers is None else workers
+        self._executor = None
+        products = dict()
+        if fixed:
+            listing = client.products.list()
+            if isinstance(listing, list):
+                products = {product['id']: product for product in listing}
+        if level == 3:
+            self.books = {
+                product_id: OrderBook(product_id, client, fixed=fixed, product=products.get(product_id))
+                for product_id in product_ids
+            }
+            self.pool(concurrent.futures.ThreadPoolExecutor(self.workers))
+        else:
+            self.books = {
+                product_id: Level2Book(product_id, client, fixed=fixed, product=products.get(product_id))
+                for product_id in product_ids
+            }
+
+    def __getitem__(self, product_id: str) -> Book:
+        return self.books[product_id]
+
+    def __iter__(self) -> object:
+        return iter(self.books.values())
+
+    def __len__(self) -> int:
+        return len(self.books)
+
+    def get_message(self) -> dict:
+        return cbpro.websocket.get_message({
+            'type': 'subscribe',
+            'product_ids': list(self.books),
+            'channels': ['full' if self.level == 3 else 'level2']
+        })
+
+    def pool(self, executor: concurrent.futures.Executor = None) -> None:
+        # NOTE: Hand the level 3 books a new snapshot pool, e.g. after a stop
+        self._executor = executor
+        for book in self.books.values():
+            book._executor = executor
+
+    def on_start(self) -> None:
+        if self.level == 3 and self._executor is None:
+            self.pool(concurrent.futures.ThreadPoolExecutor(self.workers))
+        for book in self.books.values():
+            book.on_start()
+
+    def on_stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self.pool(None)
+
+    def on_response(self, value: dict) -> None:
+        book = self.books.get(value.get('product_id'))
+        if book is not None:
+            book.on_message(value)
 
 
 if __name__ == '__main__':
-    import sys
-    import time
     import datetime as dt
-
+    import time
 
     class OrderBookConsole(OrderBook):
         ''' Logs real-time changes to the bid-ask spread to the console '''
@@ -264,14 +869,12 @@ if __name__ == '__main__':
 
         def on_message(self, message):
             super(OrderBookConsole, self).on_message(message)
+            if not self._bids or not self._asks:
+                return
 
-            # Calculate newest bid-ask spread
-            bid = self.get_bid()
-            bids = self.get_bids(bid)
-            bid_depth = sum([b['size'] for b in bids])
-            ask = self.get_ask()
-            asks = self.get_asks(ask)
-            ask_depth = sum([a['size'] for a in asks])
+            # Newest bid-ask spread; level sizes are kept up to date by the book
+            bid, bid_depth = self.get_best_bid()
+            ask, ask_depth = self.get_best_ask()
 
             if self._bid == bid and self._ask == ask and self._bid_depth == bid_depth and self._ask_depth == ask_depth:
                 # If there are no changes to the bid-ask spread since the last update, no need to print
@@ -285,15 +888,11 @@ if __name__ == '__main__':
                 print('{} {} bid: {:.3f} @ {:.2f}\task: {:.3f} @ {:.2f}'.format(
                     dt.datetime.now(), self.product_id, bid_depth, bid, ask_depth, ask))
 
-    order_book = OrderBookConsole()
-    order_book.start()
+    order_book = OrderBookConsole(product_id='BTC-USD')
+    client = cbpro.websocket.WebsocketClient(cbpro.websocket.WebsocketStream(), order_book)
+    client.run(order_book.get_message())
     try:
         while True:
             time.sleep(10)
     except KeyboardInterrupt:
-        order_book.close()
-
-    if order_book.error:
-        sys.exit(1)
-    else:
-        sys.exit(0)
+        client.stop()
@@ -1,7 +1,40 @@
+import collections
+import concurrent.futures
+import functools
+import itertools
+
 import cbpro.messenger
+import cbpro.store
+
+from iso8601 import parse_date
+
+from cbpro.utils import get_epoch
+from cbpro.utils import get_isoformat
+from cbpro.utils import Intervals
+from cbpro.utils import merge_candles
+
 
-from cbpro.utils import get_time_intervals
-from time import sleep
+def ordered(calls: list, workers: int = None) -> object:
+    """Yield the result of every call in order, running up to `workers` calls ahead."""
+    if workers is None or workers < 1:
+        for call in calls:
+            yield call()
+        return
+
+    window = collections.deque()
+    calls = iter(calls)
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        try:
+            for call in itertools.islice(calls, workers):
+                window.append(executor.submit(call))
+            while window:
+                result = window.popleft().result()
+                for call in itertools.islice(calls, 1):
+                    window.append(executor.submit(call))
+                yield result
+        finally:
+            for future in window:
+                future.cancel()
 
 
 class Products(cbpro.messenger.Subscriber):
@@ -41,28 +74,329 @@ class Products(cbpro.messenger.Subscriber):
 
 
 class History(cbpro.messenger.Subscriber):
-    def candles(self, product_id: str, params: dict = None):
+    def __init__(self,
+                 messenger: cbpro.messenger.Messenger,
+                 store: cbpro.store.CandleStore = None) -> None:
+
+        super(History, self).__init__(messenger)
+        self.store = store
+
+    def plan(self, product_id: str, params: dict, covered: list = None) -> list:
+        """Get the (endpoint, params) pair of every request needed to cover params.start to params.end.
+
+        Requests are aligned to granularity boundaries, ascending, and hold 300 candles each except the
+        last one of every gap; buckets within the `covered` (start, end) ranges are not requested.
+        """
+        endpoint = f"/products/{product_id}/candles"
+        granularity = params["granularity"]
+        start = get_epoch(params["start"])
+        end = get_epoch(params["end"])
+
+        plan = []
+        for interval_start, interval_end in Intervals(start, end, granularity, covered):
+            loop_params = params.copy()
+            loop_params["start"] = get_isoformat(interval_start)
+            loop_params["end"] = get_isoformat(interval_end)
+            plan.append((endpoint, loop_params))
+
+        return plan
+
+    def merge(self, responses: list, columnar: bool = False) -> list:
+        """Merge the responses of all interval requests into one list sorted by time ascending.
+
+        With `columnar`, the candles are merged into a NumPy structured array instead (see `cbpro.frame`).
+        """
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+            if not isinstance(response, list):
+                # NOTE: Return the error message the same way Messenger does
+                return response
+        if columnar:
+            import cbpro.frame
+
+            return cbpro.frame.to_array(responses)
+        return merge_candles(responses)
+
+    def fetch(self,
+              plan: list,
+              workers: int = None,
+              progress: object = None) -> list:
+        """Send every (endpoint, params) request in plan and return the responses in order."""
+        calls = [
+            functools.partial(self.messenger.get, endpoint, params=loop_params)
+            for endpoint, loop_params in plan
+        ]
+
+        if workers is not None:
+            return self.messenger.batch(calls, workers, progress)
+
+        responses = []
+        for call in calls:
+            responses.append(call())
+            if progress is not None:
+                progress(len(responses), len(calls))
+
+        return responses
+
+    def candles(self,
+                product_id: str,
+                params: dict = None,
+                workers: int = None,
+                progress: object = None,
+                columnar: bool = False) -> list:
         """Get all candles for a given time frame from params.start to params.end.
 
         If the requested time range is too large, the request is separated into multiple time intervals.
+        Set `workers` to send the interval requests concurrently within the rate limit.
+        `progress(done, total)` is called as each interval request completes.
+        With a `store`, only the ranges it does not cover yet are requested.
+        With `columnar`, a NumPy structured array is returned instead of a list (see `cbpro.frame`).
         """
-        endpoint = f"/products/{product_id}/candles"
+        if self.store is None:
+            plan = self.plan(product_id, params)
+            return self.merge(self.fetch(plan, workers, progress), columnar)
+
+        covered = self.store.covered(product_id, params["granularity"])
+        plan = self.plan(product_id, params, covered)
+        return self.save(product_id, params, plan, self.fetch(plan, workers, progress), columnar)
+
+    def chunk(self, response: list, last: int = None) -> list:
+        """Sort one interval response by time ascending, dropping candles at or before `last`."""
+        chunk = sorted(response, key=lambda candle: candle[0])
+        if last is None:
+            return chunk
+        return [candle for candle in chunk if candle[0] > last]
+
+    def stream(self,
+               product_id: str,
+               params: dict = None,
+               workers: int = None) -> object:
+        """Yield the candles of each interval from params.start to params.end as soon as they arrive.
+
+        Chunks are yielded in ascending time order and boundary candles are yielded once.
+        Set `workers` to fetch up to that many intervals ahead of the consumer; memory stays bounded by the
+        look-ahead instead of the whole range.
+        Raises `ResponseError` with the error message if a request fails, so a series is never cut short silently.
+        """
+        calls = [
+            functools.partial(self.messenger.get, endpoint, params=loop_params)
+            for endpoint, loop_params in self.plan(product_id, params)
+        ]
+
+        last = None
+        for response in self.ordered(calls, workers):
+            if not isinstance(response, list):
+                raise cbpro.messenger.ResponseError(response)
+            chunk = self.chunk(response, last)
+            if chunk:
+                last = chunk[-1][0]
+                yield chunk
+
+    def ordered(self, calls: list, workers: int = None) -> object:
+        """Yield the result of every call in order, running up to `workers` calls ahead."""
+        return ordered(calls, workers)
+
+    def save(self,
+             product_id: str,
+             params: dict,
+             plan: list,
+             responses: list,
+             columnar: bool = False) -> list:
+        """Store the response of every planned request, then read the full params.start to params.end range back."""
+        granularity = params["granularity"]
+        for (_, loop_params), response in zip(plan, responses):
+            candles = self.merge([response])
+            if not isinstance(candles, list):
+                return candles
+            start = get_epoch(loop_params["start"])
+            end = get_epoch(loop_params["end"])
+            self.store.insert(product_id, granularity, candles, start, end)
 
-        all_candles = []
-        loop_params = params.copy()
-        for start, end in get_time_intervals(params):
-            loop_params["start"] = start
-            loop_params["end"] = end
-            candles = self.messenger.get(endpoint, params=loop_params)
-            all_candles += candles
+        start = get_epoch(params["start"])
+        end = get_epoch(params["end"])
+        candles = self.store.select(product_id, granularity, start, end)
+        return self.merge([candles], columnar) if columnar else candles
+
+
+def get_next_page(params: dict, response: list) -> dict:
+    """Get the params of the next page of a trade id chunk, or None once the chunk is complete.
+
+    Every page of a chunk asks for the ids from `after - limit` to `after - 1`, so the server may return fewer
+    trades than asked for (e.g. when it caps the page size) and the rest is requested from the lowest id it sent.
+    """
+    if not response:
+        return None
+    lowest = min(trade["trade_id"] for trade in response)
+    lo = params["after"] - params["limit"]
+    if lowest <= lo:
+        return None
+    return {"after": lowest, "limit": lowest - lo}
+
+
+def get_latest(response: object) -> dict:
+    """Get the trade of a `limit=1` trades response, None if there are no trades."""
+    if not isinstance(response, list):
+        raise cbpro.messenger.ResponseError(response)
+    return response[0] if response else None
+
+
+def get_bisect(lo: int, hi: int, mid: int, response: object, when: object) -> tuple:
+    """Narrow the (lo, hi) trade id range of a search from the newest trade with an id at or below mid."""
+    if not isinstance(response, list):
+        raise cbpro.messenger.ResponseError(response)
+    if response and parse_date(response[0]["time"]) >= when:
+        return lo, mid
+    return mid + 1, hi
+
+
+class Backfill(cbpro.messenger.Subscriber):
+    def plan(self, product_id: str, first: int, last: int, limit: int = 1000) -> list:
+        """Get the (endpoint, params) pair of every request needed to cover trade ids first to last.
+
+        The `after` cursor is a trade id, so the range is split into disjoint chunks of `limit` ids that can be
+        fetched independently. Chunks are ascending and each one covers the ids `after - limit` to `after - 1`.
+        """
+        endpoint = f"/products/{product_id}/trades"
+        plan = []
+        for lo in range(first, last + 1, limit):
+            hi = min(lo + limit - 1, last)
+            plan.append((endpoint, {"after": hi + 1, "limit": hi - lo + 1}))
+        return plan
+
+    def chunk(self, response: list, first: int, last: int) -> list:
+        """Sort one chunk response by trade id ascending, dropping trades outside of first to last."""
+        trades = [trade for trade in response if first <= trade["trade_id"] <= last]
+        return sorted(trades, key=lambda trade: trade["trade_id"])
+
+    def collect(self, endpoint: str, params: dict) -> list:
+        """Get every trade of one planned chunk, following the cursor until the chunk is complete."""
+        trades = []
+        while params is not None:
+            response = self.messenger.get(endpoint, params=params)
+            if not isinstance(response, list):
+                # NOTE: Return the error message the same way Messenger does
+                return response
+            trades.extend(response)
+            params = get_next_page(params, response)
+        return trades
+
+    def fetch(self,
+              plan: list,
+              workers: int = None,
+              progress: object = None) -> list:
+        """Collect every planned chunk and return the responses in order."""
+        calls = [
+            functools.partial(self.collect, endpoint, params)
+            for endpoint, params in plan
+        ]
+
+        if workers is not None:
+            return self.messenger.batch(calls, workers, progress)
+
+        responses = []
+        for call in calls:
+            responses.append(call())
+            if progress is not None:
+                progress(len(responses), len(calls))
+
+        return responses
+
+    def merge(self, responses: list, first: int, last: int) -> list:
+        """Merge the chunk responses into one list of trades sorted by trade id ascending."""
+        trades = {}
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+            if not isinstance(response, list):
+                # NOTE: Return the error message the same way Messenger does
+                return response
+            for trade in self.chunk(response, first, last):
+                trades[trade["trade_id"]] = trade
+
+        return [trades[trade_id] for trade_id in sorted(trades)]
+
+    def trades(self,
+               product_id: str,
+               first: int,
+               last: int,
+               workers: int = None,
+               progress: object = None) -> list:
+        """Get all trades with a trade id from first to last, sorted by trade id ascending.
+
+        Set `workers` to fetch the chunks concurrently within the rate limit.
+        `progress(done, total)` is called as each chunk completes.
+        """
+        responses = self.fetch(self.plan(product_id, first, last), workers, progress)
+        return self.merge(responses, first, last)
+
+    def stream(self,
+               product_id: str,
+               first: int,
+               last: int,
+               workers: int = None) -> object:
+        """Yield the trades of each chunk from trade id first to last, in ascending order, as soon as they arrive.
+
+        Set `workers` to fetch up to that many chunks ahead of the consumer.
+        Raises `ResponseError` with the error message if a request fails.
+        """
+        plan = self.plan(product_id, first, last)
+        calls = [
+            functools.partial(self.collect, endpoint, params)
+            for endpoint, params in plan
+        ]
+
+        for (_, params), response in zip(plan, ordered(calls, workers)):
+            if not isinstance(response, list):
+                raise cbpro.messenger.ResponseError(response)
+            # NOTE: A chunk only keeps its own ids, so chunks never overlap
+            chunk = self.chunk(response, params["after"] - params["limit"], params["after"] - 1)
+            if chunk:
+                yield chunk
+
+    def latest(self, product_id: str) -> dict:
+        """Get the most recent trade, None if the product has no trades."""
+        response = self.messenger.get(f"/products/{product_id}/trades", params={"limit": 1})
+        return get_latest(response)
+
+    def search(self, product_id: str, when: str, last: int = None) -> int:
+        """Get the id of the first trade at or after the ISO 8601 time `when`, by binary search over trade ids.
+
+        Takes about log2(last) requests; `last` defaults to the latest trade id.
+        Returns None if the product has no trades.
+        """
+        endpoint = f"/products/{product_id}/trades"
+        when = parse_date(when)
+        if last is None:
+            trade = self.latest(product_id)
+            if trade is None:
+                return None
+            last = trade["trade_id"]
 
-            # sleep 0.26 seconds to prevent a timeout because a rate limit of 4 requests/second
-            sleep(0.26)
+        lo, hi = 1, last + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            response = self.messenger.get(endpoint, params={"after": mid + 1, "limit": 1})
+            lo, hi = get_bisect(lo, hi, mid, response, when)
 
-        # sort by time ascending
-        all_candles.sort(key=lambda candle: candle[0])
+        return lo
 
-        return all_candles
+    def between(self,
+                product_id: str,
+                start: str,
+                end: str,
+                workers: int = None,
+                progress: object = None) -> list:
+        """Get all trades from the ISO 8601 time start up to (excluding) end, sorted by trade id ascending."""
+        trade = self.latest(product_id)
+        if trade is None:
+            return []
+        last = trade["trade_id"]
+        first = self.search(product_id, start, last)
+        stop = self.search(product_id, end, last)
+        if stop <= first:
+            return []
+        return self.trades(product_id, first, stop - 1, workers, progress)
 
 
 class Currencies(cbpro.messenger.Subscriber):
@@ -89,6 +423,7 @@ class PublicClient(object):
         self.currencies = Currencies(messenger)
         self.time = Time(messenger)
         self.history = History(messenger)
+        self.backfill = Backfill(messenger)
 
 
 def public_client(url=None):
@@ -0,0 +1,117 @@
+#
+# Local candle store backed by SQLite
+#
+# NOTE:
+#   - Candles are keyed by (product_id, granularity, time)
+#   - Coverage records which bucket ranges have been fetched, so ranges
+#     where the exchange returned no candles are not requested again
+#   - Only closed buckets are marked as covered; the open bucket is
+#     fetched again on the next query
+import sqlite3
+import threading
+import time
+
+from cbpro.utils import merge_intervals
+
+
+schema = '''
+CREATE TABLE IF NOT EXISTS candles (
+    product_id TEXT NOT NULL,
+    granularity INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    low REAL,
+    high REAL,
+    open REAL,
+    close REAL,
+    volume REAL,
+    PRIMARY KEY (product_id, granularity, time)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS coverage (
+    product_id TEXT NOT NULL,
+    granularity INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS coverage_key ON coverage (product_id, granularity);
+'''
+
+
+def get_bucket_range(start: int, end: int, granularity: int) -> tuple:
+    # NOTE: The first and last bucket times within [start, end]
+    first = -(-start // granularity) * granularity
+    last = end // granularity * granularity
+    return first, last
+
+
+class CandleStore(object):
+    def __init__(self, path: str = None) -> None:
+        self.path = ':memory:' if path is None else path
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.executescript(schema)
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def covered(self, product_id: str, granularity: int) -> list:
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT start, end FROM coverage '
+                'WHERE product_id = ? AND granularity = ? ORDER BY start',
+                (product_id, granularity)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def insert(self,
+               product_id: str,
+               granularity: int,
+               candles: list,
+               start: int,
+               end: int) -> None:
+
+        rows = [(product_id, granularity, *candle[:6]) for candle in candles]
+        first, last = get_bucket_range(start, end, granularity)
+        closed = int(time.time()) // granularity * granularity - granularity
+        last = min(last, closed)
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            if first > last:
+                return
+            key = (product_id, granularity)
+            covered = self.connection.execute(
+                'SELECT start, end FROM coverage '
+                'WHERE product_id = ? AND granularity = ?',
+                key
+            ).fetchall()
+            merged = merge_intervals(covered + [(first, last)], granularity)
+            self.connection.execute(
+                'DELETE FROM coverage WHERE product_id = ? AND granularity = ?',
+                key
+            )
+            self.connection.executemany(
+                'INSERT INTO coverage VALUES (?, ?, ?, ?)',
+                [(*key, s, e) for s, e in merged]
+            )
+
+    def select(self,
+               product_id: str,
+               granularity: int,
+               start: int,
+               end: int) -> list:
+
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT time, low, high, open, close, volume FROM candles '
+                'WHERE product_id = ? AND granularity = ? '
+                'AND time BETWEEN ? AND ? ORDER BY time',
+                (product_id, granularity, start, end)
+            ).fetchall()
+        return [list(row) for row in rows]
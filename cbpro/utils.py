@@ -1,3 +1,5 @@
+from decimal import Decimal
+import bisect
 import datetime
 
 from iso8601 import parse_date
@@ -7,6 +9,16 @@ def filter_empty(params: dict) -> dict:
     return dict((k, v) for k, v in params.items() if v is not None)
 
 
+def get_epoch(value: str) -> int:
+    """Get the unix time in seconds for an ISO 8601 date string."""
+    return int(parse_date(value).timestamp())
+
+
+def get_isoformat(epoch: int) -> str:
+    """Get the ISO 8601 UTC date string for a unix time in seconds."""
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc).isoformat()
+
+
 def get_time_intervals(params: dict):
     """Get all time intervals that allow querying of the coinbase pro api."""
     max_candles = 300
@@ -42,3 +54,117 @@ def get_intervals(start: datetime.datetime, end: datetime.datetime, interval_len
 def time_interval_ok(start: datetime.datetime, end: datetime.datetime, interval_length: int):
     """Check if the [start, end] time interval is within the allowed interval_length."""
     return (end - start).total_seconds() <= interval_length
+
+
+def merge_candles(chunks: list) -> list:
+    """Merge candle lists from multiple requests into one list sorted by time ascending.
+
+    Adjacent intervals share their boundary, so a candle may appear in two chunks; it is kept once.
+    """
+    candles = {}
+    for chunk in chunks:
+        for candle in chunk:
+            candles[candle[0]] = candle
+    return [candles[time] for time in sorted(candles)]
+
+
+def get_missing_intervals(start: int, end: int, covered: list, step: int = 1):
+    """Get the parts of the inclusive [start, end] range that are not within the covered ranges.
+
+    All values are integers on a grid of `step`; covered is a list of inclusive (start, end) pairs.
+    """
+    missing = []
+    cursor = start
+    for covered_start, covered_end in sorted(covered):
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            missing.append((cursor, covered_start - step))
+        cursor = covered_end + step
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+def merge_intervals(intervals: list, step: int = 1):
+    """Merge overlapping or adjacent inclusive (start, end) ranges on a grid of `step`."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + step:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Intervals(object):
+    """Granularity-aligned request intervals between start and end, computed in closed form.
+
+    Intervals are inclusive (start, end) unix times of the first and last bucket of a request. They are
+    ascending, never overlap, and hold exactly `max_candles` buckets each except for the last interval of
+    every gap. Buckets within the covered ranges are skipped. Only the gaps are stored, so planning
+    millions of intervals costs no more than planning one.
+    """
+
+    def __init__(self,
+                 start: int,
+                 end: int,
+                 granularity: int,
+                 covered: list = None,
+                 max_candles: int = 300):
+        self.granularity = granularity
+        self.span = granularity * max_candles
+        self.first = -(-start // granularity) * granularity
+        self.last = end // granularity * granularity
+        self.gaps = []
+        if self.first <= self.last:
+            self.gaps = get_missing_intervals(self.first, self.last, covered or [], granularity)
+        self.offsets = [0]
+        for gap_start, gap_end in self.gaps:
+            self.offsets.append(self.offsets[-1] + (gap_end - gap_start) // self.span + 1)
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('interval index out of range')
+        gap = bisect.bisect_right(self.offsets, index) - 1
+        gap_start, gap_end = self.gaps[gap]
+        start = gap_start + (index - self.offsets[gap]) * self.span
+        return start, min(start + self.span - self.granularity, gap_end)
+
+    def __iter__(self):
+        for gap_start, gap_end in self.gaps:
+            for start in range(gap_start, gap_end + 1, self.span):
+                yield start, min(start + self.span - self.granularity, gap_end)
+
+
+def get_decimal(value: object) -> Decimal:
+    """Get a Decimal from a string, int, float or Decimal; floats are read from their shortest repr."""
+    if isinstance(value, (str, int, Decimal)):
+        return Decimal(value)
+    return Decimal(repr(value))
+
+
+def get_places(increment: str) -> int:
+    """Get the number of decimal places of an increment, e.g. '0.01000000' -> 2."""
+    exponent = get_decimal(increment).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+
+def get_fixed(value: str, places: int, step: int = 1) -> int:
+    """Get a decimal value as an exact integer scaled by 10 ** places.
+
+    Raises ValueError if the scaled value is not a whole multiple of `step`, e.g. a price with more decimal
+    places than the quote increment.
+    """
+    scaled = get_decimal(value).scaleb(places)
+    fixed = int(scaled)
+    if fixed != scaled or fixed % step:
+        raise ValueError(f'{value} is not a multiple of {Decimal(step).scaleb(-places)}')
+    return fixed
@@ -1,4 +1,3 @@
-import json
 import pymongo
 import threading
 import time
@@ -6,6 +5,7 @@ import websocket
 
 import cbpro.auth
 import cbpro.check
+import cbpro.codec
 import cbpro.utils
 
 
@@ -30,14 +30,18 @@ class WebsocketHeader(object):
     def __init__(self,
                  key: str,
                  secret: str,
-                 passphrase: str) -> None:
+                 passphrase: str,
+                 clock: cbpro.auth.Clock = None) -> None:
 
+        # NOTE: Share an `Auth.clock` to reuse its synced server offset
         self.token = cbpro.auth.Token(key, secret, passphrase)
+        self.signer = cbpro.auth.Signer(secret)
+        self.clock = cbpro.auth.Clock(interval=0) if clock is None else clock
 
     def __call__(self) -> dict:
-        timestamp = cbpro.auth.get_timestamp()
+        timestamp = self.clock.timestamp()
         message = f'{timestamp}GET/users/self/verify'
-        b64signature = cbpro.auth.get_b64signature(message, self.token)
+        b64signature = self.signer(message)
 
         return {
             'signature': b64signature,
@@ -51,11 +55,18 @@ class WebsocketStream(object):
     def __init__(self,
                  header: WebsocketHeader = None,
                  timeout: int = None,
-                 traceable: bool = False) -> None:
+                 traceable: bool = False,
+                 codec: cbpro.codec.Codec = None,
+                 binary: bool = False) -> None:
 
+        # NOTE:
+        #   - `binary` decodes frames straight from bytes, skipping the
+        #     utf-8 str that `websocket.WebSocket.recv` would build
         self.header = header
         self.timeout = 30 if timeout is None else timeout
         self.traceable = traceable
+        self.codec = cbpro.codec.get_codec() if codec is None else codec
+        self.binary = binary
         self.url = 'wss://ws-feed.pro.coinbase.com'
         self.connection = None
 
@@ -74,13 +85,16 @@ class WebsocketStream(object):
 
     def send(self, params: dict) -> None:
         if self.connected:
-            payload = json.dumps(params)
+            payload = self.codec.dumps(params)
             self.connection.send(payload)
 
     def receive(self) -> dict:
         if self.connected:
-            payload = self.connection.recv()
-            return json.loads(payload)
+            if self.binary:
+                _, payload = self.connection.recv_data()
+            else:
+                payload = self.connection.recv()
+            return self.codec.loads(payload)
         return dict()
 
     def ping(self) -> None:
@@ -20,6 +20,14 @@ tests_require = [
     'python-dateutil',
 ]
 
+async_require = [
+    'aiohttp',
+]
+
+numpy_require = [
+    'numpy',
+]
+
 keywords = [
     'cbpro', 'gdax', 'gdax-api', 'orderbook', 'trade',
     'bitcoin', 'ethereum', 'BTC', 'ETH', 'client', 'api', 'wrapper',
@@ -42,6 +50,8 @@ setup(
     tests_require=tests_require,
     extras_require={
         'test': tests_require,
+        'async': async_require,
+        'numpy': numpy_require,
     },
     description='The unofficial Python client for the Coinbase Pro API',
     long_description=long_description,
@@ -0,0 +1,247 @@
+from iso8601 import parse_date
+
+import asyncio
+import datetime
+import functools
+import inspect
+import pytest
+
+import cbpro.aio
+import cbpro.auth
+import cbpro.limiter
+import cbpro.messenger
+import cbpro.public
+
+aiohttp = pytest.importorskip('aiohttp')
+web = pytest.importorskip('aiohttp.web')
+
+
+def run_with_server(routes: list, callback: object) -> object:
+    async def main():
+        app = web.Application()
+        app.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        backoff = cbpro.limiter.Backoff(retries=3, base=0.001)
+        messenger = cbpro.aio.AsyncMessenger(
+            url=f'http://127.0.0.1:{port}', backoff=backoff
+        )
+        try:
+            return await callback(messenger)
+        finally:
+            await messenger.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_async_public_client():
+    messenger = cbpro.aio.AsyncMessenger()
+    client = cbpro.aio.AsyncPublicClient(messenger)
+
+    assert isinstance(client, cbpro.public.PublicClient)
+    assert isinstance(client.products, cbpro.public.Products)
+    assert isinstance(client.history, cbpro.aio.AsyncHistory)
+    assert inspect.iscoroutinefunction(client.history.candles)
+
+
+def test_async_messenger_get():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return web.json_response({'message': 'slow down'}, status=429)
+        return web.json_response({'iso': 'now'})
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        return await client.time.get()
+
+    response = run_with_server([web.get('/time', handler)], callback)
+
+    assert response == {'iso': 'now'}
+    assert len(calls) == 2
+
+
+def test_async_messenger_paginate():
+    async def handler(request):
+        after = int(request.query.get('after', 3))
+        headers = {'CB-AFTER': str(after - 1)} if after > 1 else {}
+        return web.json_response([{'trade_id': after}], headers=headers)
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        return [t async for t in client.products.trades('BTC-USD')]
+
+    routes = [web.get('/products/BTC-USD/trades', handler)]
+    response = run_with_server(routes, callback)
+
+    assert [t['trade_id'] for t in response] == [3, 2, 1]
+
+
+def test_async_messenger_paginate_error():
+    async def handler(request):
+        if 'after' in request.query:
+            return web.json_response({'message': 'Invalid limit'}, status=400)
+        return web.json_response([{'trade_id': 3}], headers={'CB-AFTER': '2'})
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        trades = []
+        with pytest.raises(cbpro.messenger.ResponseError) as raised:
+            async for trade in client.products.trades('BTC-USD'):
+                trades.append(trade)
+        return trades, raised.value.response
+
+    routes = [web.get('/products/BTC-USD/trades', handler)]
+    trades, response = run_with_server(routes, callback)
+
+    assert [t['trade_id'] for t in trades] == [3]
+    assert response == {'message': 'Invalid limit'}
+
+
+def test_async_messenger_auth(config):
+    auth = cbpro.auth.Auth(*config)
+    messenger = cbpro.aio.AsyncMessenger(auth=auth, url='http://local/api')
+
+    url, body, headers = messenger.prepare(
+        'GET', '/orders', params={'status': 'open', 'product_id': None}
+    )
+
+    assert url == 'http://local/api/orders?status=open'
+    assert body == b''
+    assert 'CB-ACCESS-SIGN' in headers
+
+
+@pytest.mark.parametrize('workers', [2, 0])
+def test_async_messenger_batch(workers):
+    async def handler(request):
+        product_id = request.match_info['product_id']
+        if product_id == 'BAD-USD':
+            return web.json_response({'message': 'NotFound'}, status=404)
+        return web.json_response({'product_id': product_id})
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        calls = [
+            functools.partial(client.products.ticker, product_id)
+            for product_id in ('BTC-USD', 'BAD-USD', 'ETH-USD')
+        ]
+        return await messenger.batch(calls, workers=workers)
+
+    routes = [web.get('/products/{product_id}/ticker', handler)]
+    response = run_with_server(routes, callback)
+
+    assert response == [
+        {'product_id': 'BTC-USD'},
+        {'message': 'NotFound'},
+        {'product_id': 'ETH-USD'}
+    ]
+
+
+def test_async_messenger_coalesce():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return web.json_response({'price': '1.00'})
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        return await asyncio.gather(
+            *(client.products.ticker('BTC-USD') for _ in range(5))
+        )
+
+    routes = [web.get('/products/{product_id}/ticker', handler)]
+    response = run_with_server(routes, callback)
+
+    assert len(calls) == 1
+    assert response == [{'price': '1.00'}] * 5
+
+
+def test_async_history_stream():
+    async def handler(request):
+        start = int(parse_date(request.query['start']).timestamp())
+        end = int(parse_date(request.query['end']).timestamp())
+        return web.json_response([
+            [t, 1.0, 2.0, 1.0, 2.0, 10.0] for t in range(end, start - 1, -86400)
+        ])
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        end = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        params = {"start": (end - datetime.timedelta(days=700)).isoformat(),
+                  "end": end.isoformat(), "granularity": 86400}
+        stream = client.history.stream('BTC-USD', params, workers=2)
+        return [chunk async for chunk in stream]
+
+    routes = [web.get('/products/{product_id}/candles', handler)]
+    chunks = run_with_server(routes, callback)
+    times = [candle[0] for chunk in chunks for candle in chunk]
+
+    assert len(chunks) == 3
+    assert times == sorted(set(times))
+    assert len(times) == 701
+
+
+def test_async_history_stream_error():
+    async def handler(request):
+        return web.json_response({'message': 'NotFound'}, status=404)
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        end = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        params = {"start": (end - datetime.timedelta(days=700)).isoformat(),
+                  "end": end.isoformat(), "granularity": 86400}
+        with pytest.raises(cbpro.messenger.ResponseError) as error:
+            async for _ in client.history.stream('BTC-USD', params):
+                pass
+        return error.value.response
+
+    routes = [web.get('/products/{product_id}/candles', handler)]
+
+    assert run_with_server(routes, callback) == {'message': 'NotFound'}
+
+
+def test_async_backfill_trades():
+    async def handler(request):
+        # NOTE: Pages hold at most 100 trades whatever the limit
+        after = int(request.query['after'])
+        limit = min(int(request.query['limit']), 100)
+        return web.json_response([
+            {'trade_id': i, 'time': '2021-01-01T00:00:00+00:00'}
+            for i in range(after - 1, max(0, after - 1 - limit), -1)
+        ])
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        return await client.backfill.trades('BTC-USD', 5, 1304, workers=3)
+
+    routes = [web.get('/products/{product_id}/trades', handler)]
+    trades = run_with_server(routes, callback)
+
+    assert [trade['trade_id'] for trade in trades] == list(range(5, 1305))
+
+
+def test_async_backfill_errors():
+    async def handler(request):
+        if 'after' in request.query:
+            return web.json_response({'message': 'NotFound'}, status=404)
+        return web.json_response([])
+
+    async def callback(messenger):
+        client = cbpro.aio.AsyncPublicClient(messenger)
+        when = '2021-01-01T00:00:00+00:00'
+        between = await client.backfill.between('BTC-USD', when, when)
+        with pytest.raises(cbpro.messenger.ResponseError):
+            await client.backfill.search('BTC-USD', when, last=4)
+        return between
+
+    routes = [web.get('/products/{product_id}/trades', handler)]
+
+    assert run_with_server(routes, callback) == []
@@ -1,5 +1,6 @@
 import pytest
 import requests
+import time
 import cbpro.auth
 
 
@@ -26,6 +27,42 @@ def test_auth(config):
     assert callable(auth)
 
 
+def test_signer(config):
+    key, secret, passphrase = config
+    token = cbpro.auth.Token(key, secret, passphrase)
+    signer = cbpro.auth.Signer(secret)
+    message = '1600000000.0GET/accounts'
+
+    assert signer(message) == cbpro.auth.get_b64signature(message, token)
+    assert signer(message) == signer(message)
+
+
+def test_clock():
+    clock = cbpro.auth.Clock(interval=60)
+
+    assert clock.stale
+    assert clock.due()
+    assert not clock.due()
+
+    now = time.time()
+    offset = clock.sync(now + 10, now - 0.1, now + 0.1)
+
+    assert abs(offset - 10) < 1e-6
+    assert abs(clock.time() - time.time() - 10) < 0.1
+    assert not clock.stale
+    assert not cbpro.auth.Clock(interval=0).stale
+
+
+def test_auth_sign(config):
+    auth = cbpro.auth.Auth(*config)
+    auth.clock.offset = 100.0
+
+    headers = auth.sign('GET', '/accounts')
+
+    assert abs(float(headers['CB-ACCESS-TIMESTAMP']) - time.time() - 100) < 1
+    assert headers['CB-ACCESS-KEY'] == auth.token.key
+
+
 @pytest.mark.skip
 def test_auth_request(sandbox, auth):
     assert 'sandbox' in sandbox
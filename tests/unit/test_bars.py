@@ -0,0 +1,144 @@
+import threading
+
+import cbpro.bars
+
+
+def get_trade(trade_id: int, seconds: float, price: float, size: float = 1.0) -> dict:
+    minutes, seconds = divmod(seconds, 60)
+    return {
+        'type': 'match',
+        'trade_id': trade_id,
+        'product_id': 'BTC-USD',
+        'time': f'2021-01-01T00:{int(minutes):02d}:{seconds:06.3f}Z',
+        'price': str(price),
+        'size': str(size)
+    }
+
+
+class DummyProducts(object):
+    def __init__(self, trades: list) -> None:
+        self.trades_ = trades
+        self.calls = 0
+        self.release = None
+
+    def trades(self, product_id: str, params: dict = None) -> object:
+        # NOTE:
+        #   - Newest first, like Products.trades
+        #   - Blocks until `release` is set, like a slow download
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait()
+        yield from reversed(self.trades_)
+
+
+class DummyClient(object):
+    def __init__(self, trades: list) -> None:
+        self.products = DummyProducts(trades)
+
+
+class RecordingBuilder(cbpro.bars.BarBuilder):
+    def __init__(self, *args, **kwargs) -> None:
+        super(RecordingBuilder, self).__init__(*args, **kwargs)
+        self.emitted = []
+
+    def on_bar(self, product_id: str, granularity: int, candle: list) -> None:
+        self.emitted.append((product_id, granularity, candle))
+
+
+def test_bar_builder_granularities():
+    # arrange
+    builder = RecordingBuilder(granularities=[5, 60])
+    origin = 1609459200
+
+    # act
+    builder.on_response(get_trade(1, 1, 100.0))
+    builder.on_response(get_trade(2, 3, 105.0, 2.0))
+    builder.on_response(get_trade(3, 4, 95.0))
+    builder.on_response(get_trade(4, 7, 101.0))
+
+    # assert
+    assert builder.emitted == [('BTC-USD', 5, [origin, 95.0, 105.0, 100.0, 95.0, 4.0])]
+    assert builder.current('BTC-USD', 5) == [origin + 5, 101.0, 101.0, 101.0, 101.0, 1.0]
+    assert builder.current('BTC-USD', 60) == [origin, 95.0, 105.0, 100.0, 101.0, 5.0]
+
+
+def test_bar_builder_flush_and_duplicates():
+    # arrange
+    builder = RecordingBuilder(granularities=[5])
+
+    # act
+    builder.on_response(get_trade(1, 1, 100.0))
+    builder.on_response(get_trade(1, 1, 100.0))
+    builder.on_response({'type': 'heartbeat', 'time': '2021-01-01T00:00:05.5Z'})
+    builder.on_response(get_trade(2, 4.9, 99.0))
+
+    # assert
+    assert len(builder.emitted) == 1
+    assert builder.emitted[0][2][5] == 1.0
+    assert builder.current('BTC-USD', 5) is None
+    assert builder.history('BTC-USD', 5) == [builder.emitted[0][2]]
+
+
+def test_bar_builder_closes_quiet_bars():
+    # arrange
+    builder = RecordingBuilder(granularities=[5])
+    other = dict(get_trade(1, 12, 2000.0), product_id='ETH-USD')
+
+    # act
+    builder.on_response(get_trade(1, 1, 100.0))
+    builder.on_response({'type': 'heartbeat', 'product_id': 'BTC-USD',
+                         'time': '2021-01-01T00:00:04.9Z'})
+    before = len(builder.emitted)
+    builder.on_response(other)
+
+    # assert
+    assert before == 0
+    assert [product_id for product_id, _, _ in builder.emitted] == ['BTC-USD']
+    assert builder.current('BTC-USD', 5) is None
+    assert builder.current('ETH-USD', 5) == [1609459210, 2000.0, 2000.0, 2000.0, 2000.0, 1.0]
+
+
+def test_bar_builder_backfill():
+    # arrange
+    rest = [get_trade(i, i, 100.0 + i) for i in range(1, 70)]
+    client = DummyClient(rest)
+    builder = RecordingBuilder(granularities=[10, 60], client=client)
+
+    # act
+    builder.on_response(get_trade(68, 68, 168.0))
+    builder.workers['BTC-USD'].join()
+    builder.on_response(get_trade(70, 70, 170.0))
+
+    # assert
+    assert client.products.calls == 1
+    assert builder.current('BTC-USD', 60)[3] == 160.0
+    assert builder.current('BTC-USD', 60)[5] == 10.0
+    assert builder.emitted == [('BTC-USD', 10, [1609459260, 160.0, 168.0, 160.0, 168.0, 9.0])]
+
+
+def test_get_message():
+    message = cbpro.bars.get_message(['BTC-USD', 'ETH-USD'])
+    assert message['channels'] == ['matches', 'heartbeat']
+    assert message['product_ids'] == ['BTC-USD', 'ETH-USD']
+
+
+def test_bar_builder_backfill_off_listener():
+    # arrange
+    rest = [get_trade(i, i, 100.0) for i in range(1, 5)]
+    client = DummyClient(rest)
+    client.products.release = threading.Event()
+    builder = RecordingBuilder(granularities=[60], client=client)
+
+    # act
+    builder.on_response(get_trade(5, 5, 105.0))
+    builder.on_response(get_trade(6, 6, 106.0))
+    builder.on_response({'type': 'heartbeat', 'time': '2021-01-01T00:01:30Z'})
+    during = (builder.current('BTC-USD', 60), list(builder.emitted))
+    client.products.release.set()
+    builder.workers['BTC-USD'].join()
+    builder.on_response({'type': 'heartbeat', 'time': '2021-01-01T00:01:31Z'})
+
+    # assert
+    assert during == (None, [])
+    assert builder.emitted == [('BTC-USD', 60, [1609459200, 100.0, 106.0, 100.0, 106.0, 6.0])]
+    assert not builder.pending
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import cbpro.auth
+import cbpro.cache
+
+
+def test_cache_ttl_patterns():
+    cache = cbpro.cache.Cache()
+
+    assert cache.ttl('/products') == 300
+    assert cache.ttl('/products/BTC-USD') == 300
+    assert cache.ttl('/products/BTC-USD/ticker') is None
+    assert cache.ttl('/accounts') is None
+
+
+def test_cache_key():
+    first = cbpro.cache.get_key('/profiles', {'active': True, 'x': None})
+    second = cbpro.cache.get_key('/profiles', {'active': True})
+
+    assert first == second
+    assert cbpro.cache.get_key('/time') == ('/time', ())
+
+
+def test_cache_key_identity():
+    alice = cbpro.auth.Auth('alice', 'c2VjcmV0', 'passphrase')
+    bob = cbpro.auth.Auth('bob', 'c2VjcmV0', 'passphrase')
+    keys = [
+        cbpro.cache.get_key('/profiles', None, cbpro.cache.get_identity(auth))
+        for auth in (alice, bob, None)
+    ]
+
+    assert len(set(keys)) == 3
+    assert keys[2] == ('/profiles', ())
+
+
+def test_cache_hit_miss_expiry():
+    cache = cbpro.cache.Cache()
+    key = cbpro.cache.get_key('/time')
+
+    assert cache.get(key) == (False, None)
+    cache.set(key, {'epoch': 1}, ttl=0.05)
+    assert cache.get(key) == (True, {'epoch': 1})
+    time.sleep(0.06)
+    assert cache.get(key) == (False, None)
+
+    assert cache.stats['hits'] == 1
+    assert cache.stats['misses'] == 2
+
+
+def test_cache_lru_eviction():
+    cache = cbpro.cache.Cache(maxsize=2)
+
+    cache.set(('/a', ()), 1, ttl=60)
+    cache.set(('/b', ()), 2, ttl=60)
+    cache.get(('/a', ()))
+    cache.set(('/c', ()), 3, ttl=60)
+
+    assert cache.get(('/a', ()))[0]
+    assert not cache.get(('/b', ()))[0]
+    assert cache.stats['evictions'] == 1
+
+
+def test_cache_invalidate():
+    cache = cbpro.cache.Cache()
+    cache.set(('/products', ()), [], ttl=60)
+    cache.set(('/products/BTC-USD', ()), {}, ttl=60)
+    cache.set(('/currencies', ()), [], ttl=60)
+
+    assert cache.invalidate('/products') == 2
+    assert len(cache) == 1
+    assert cache.invalidate() == 1
+    assert len(cache) == 0
+
+
+def test_single_flight():
+    flights = cbpro.cache.SingleFlight()
+    calls = []
+    results = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'price': '1.00'}
+
+    def worker():
+        results.append(flights.do(('/ticker', ()), call))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert not flights.flights
@@ -0,0 +1,25 @@
+import pytest
+
+import cbpro.codec
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson', 'ujson'])
+def test_codec_roundtrip(name):
+    try:
+        codec = cbpro.codec.get_codec(name)
+    except ImportError:
+        pytest.skip(f'{name} is not installed')
+
+    value = {'type': 'match', 'price': '1.00', 'sequence': 2 ** 40}
+    payload = codec.dumps(value)
+
+    assert isinstance(payload, bytes)
+    assert codec.loads(payload) == value
+    assert codec.loads(payload.decode('utf-8')) == value
+
+
+def test_codec_default():
+    codec = cbpro.codec.get_codec()
+
+    assert isinstance(codec, cbpro.codec.Codec)
+    assert codec.name in cbpro.codec.codecs
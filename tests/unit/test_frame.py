@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import cbpro.frame  # noqa: E402
+
+
+def candles(times: list) -> list:
+    # [time, low, high, open, close, volume]
+    return [[t, t - 1.0, t + 1.0, t + 0.0, t + 0.5, 1.0] for t in times]
+
+
+def test_to_array():
+    chunks = [candles([240, 180, 120]), candles([120, 60, 0])]
+
+    result = cbpro.frame.to_array(chunks)
+
+    assert result.dtype == cbpro.frame.dtype
+    assert result['time'].tolist() == [0, 60, 120, 180, 240]
+    assert result['close'].tolist() == [0.5, 60.5, 120.5, 180.5, 240.5]
+    assert len(cbpro.frame.to_array([])) == 0
+
+
+def test_to_columns():
+    result = cbpro.frame.to_columns(cbpro.frame.to_array([candles([0, 60])]))
+
+    assert list(result) == list(cbpro.frame.dtype.names)
+    assert result['time'].tolist() == [0, 60]
+
+
+def test_resample():
+    array = cbpro.frame.to_array([candles(range(0, 600, 60))])
+
+    result = cbpro.frame.resample(array, 300)
+
+    assert result['time'].tolist() == [0, 300]
+    assert result['open'].tolist() == [0.0, 300.0]
+    assert result['close'].tolist() == [240.5, 540.5]
+    assert result['low'].tolist() == [-1.0, 299.0]
+    assert result['high'].tolist() == [241.0, 541.0]
+    assert result['volume'].tolist() == [5.0, 5.0]
+
+
+def test_fill_gaps():
+    array = cbpro.frame.to_array([candles([0, 180])])
+
+    result = cbpro.frame.fill_gaps(array, 60)
+
+    assert result['time'].tolist() == [0, 60, 120, 180]
+    assert result['close'].tolist() == [0.5, 0.5, 0.5, 180.5]
+    assert result['open'].tolist() == [0.0, 0.5, 0.5, 180.0]
+    assert result['volume'].tolist() == [1.0, 0.0, 0.0, 1.0]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import cbpro.limiter
+
+
+def test_token_bucket_burst():
+    bucket = cbpro.limiter.TokenBucket(rate=5, capacity=10)
+
+    delays = [bucket.reserve() for _ in range(10)]
+
+    assert all(delay == 0 for delay in delays)
+    assert bucket.reserve() > 0
+
+
+def test_token_bucket_debt_is_ordered():
+    bucket = cbpro.limiter.TokenBucket(rate=10, capacity=1)
+
+    assert bucket.reserve() == 0
+    first = bucket.reserve()
+    second = bucket.reserve()
+
+    assert 0 < first < second
+    assert abs((second - first) - 0.1) < 0.01
+
+
+def test_token_bucket_threads():
+    bucket = cbpro.limiter.TokenBucket(rate=100, capacity=5)
+    threads = [
+        threading.Thread(target=bucket.acquire) for _ in range(25)
+    ]
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    # 5 burst tokens are free, the other 20 are paid at 100 per second
+    assert elapsed >= 0.19
+
+
+def test_limiter_buckets():
+    limiter = cbpro.limiter.Limiter()
+
+    assert limiter.bucket(private=False) is limiter.public
+    assert limiter.bucket(private=True) is limiter.private
+    assert limiter.public.rate == 3
+    assert limiter.private.capacity == 10
+
+
+def test_token_bucket_adaptive():
+    bucket = cbpro.limiter.TokenBucket(rate=4, capacity=8, floor=1)
+
+    assert bucket.decrease() == 2
+    assert bucket.decrease() == 1
+    assert bucket.decrease() == 1
+    assert bucket.tokens <= 0
+
+    for _ in range(100):
+        bucket.increase()
+
+    assert bucket.rate == bucket.ceiling == 4
+
+
+def test_backoff_delay():
+    backoff = cbpro.limiter.Backoff(retries=3, base=1, cap=4)
+
+    assert all(0 <= backoff.delay(n) <= min(4, 2 ** n) for n in range(10))
@@ -2,7 +2,16 @@ from tests.unit.utils import Teardown
 
 import pytest
 import requests
+import concurrent.futures
+import functools
 import inspect
+import json
+import socket
+import threading
+import time
+import cbpro.auth
+import cbpro.cache
+import cbpro.limiter
 import cbpro.messenger
 
 
@@ -12,6 +21,7 @@ class TestMessenger(Teardown):
         assert hasattr(messenger, 'url')
         assert hasattr(messenger, 'timeout')
         assert hasattr(messenger, 'session')
+        assert hasattr(messenger, 'limiter')
         assert hasattr(messenger, 'route')
         assert hasattr(messenger, 'get')
         assert hasattr(messenger, 'post')
@@ -22,6 +32,7 @@ class TestMessenger(Teardown):
         assert isinstance(messenger.url, str)
         assert isinstance(messenger.timeout, int)
         assert isinstance(messenger.session, requests.Session)
+        assert isinstance(messenger.limiter, cbpro.limiter.Limiter)
 
     def test_messenger_get(self, messenger):
         response = messenger.get('/time')
@@ -49,6 +60,273 @@ class TestMessenger(Teardown):
         assert inspect.isgenerator(response)
 
 
+class DummyResponse(object):
+    def __init__(self, status_code: int, body: object = None) -> None:
+        self.status_code = status_code
+        self.headers = dict()
+        self.body = dict() if body is None else body
+
+    @property
+    def content(self) -> bytes:
+        return json.dumps(self.body).encode('utf-8')
+
+
+class DummySession(object):
+    def __init__(self, responses: list) -> None:
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method: str, url: str, **kwargs: dict) -> object:
+        self.calls.append((method, url))
+        return self.responses.pop(0)
+
+    def get(self, url: str, **kwargs: dict) -> object:
+        return self.request('GET', url, **kwargs)
+
+
+def dummy_messenger(responses: list,
+                    auth: cbpro.auth.Auth = None) -> cbpro.messenger.Messenger:
+    backoff = cbpro.limiter.Backoff(retries=3, base=0.001)
+    messenger = cbpro.messenger.Messenger(auth=auth, backoff=backoff)
+    messenger.session = DummySession(responses)
+    return messenger
+
+
+def test_messenger_retry_get():
+    messenger = dummy_messenger([
+        DummyResponse(429), DummyResponse(502), DummyResponse(200, {'ok': 1})
+    ])
+    rate = messenger.limiter.public.rate
+
+    assert messenger.get('/time') == {'ok': 1}
+    assert len(messenger.session.calls) == 3
+    assert messenger.limiter.public.rate < rate
+
+
+def test_messenger_retry_exhausted():
+    messenger = dummy_messenger([DummyResponse(503)] * 4)
+
+    response = messenger.send('GET', '/time')
+
+    assert response.status_code == 503
+    assert len(messenger.session.calls) == 4
+
+
+def test_messenger_no_retry_post():
+    messenger = dummy_messenger([DummyResponse(429, {'message': 'slow'})])
+
+    assert messenger.post('/orders') == {'message': 'slow'}
+    assert len(messenger.session.calls) == 1
+
+
+def test_messenger_clock_sync(config):
+    epoch = time.time() + 120
+    auth = cbpro.auth.Auth(*config)
+    messenger = dummy_messenger([
+        DummyResponse(200, {'epoch': epoch}),
+        DummyResponse(400, {'message': 'request timestamp expired'}),
+        DummyResponse(200, {'epoch': epoch}),
+        DummyResponse(200, {'id': 'abc'})
+    ], auth=auth)
+
+    assert messenger.post('/orders', json={'size': 1.0}) == {'id': 'abc'}
+    assert [c[1].split('/')[-1] for c in messenger.session.calls] == [
+        'time', 'orders', 'time', 'orders'
+    ]
+    assert abs(auth.clock.offset - 120) < 1
+
+
+def test_messenger_cache():
+    messenger = dummy_messenger([
+        DummyResponse(200, [{'id': 'BTC-USD'}]), DummyResponse(200, [])
+    ])
+    messenger.cache = cbpro.cache.Cache()
+
+    first = messenger.get('/products')
+    second = messenger.get('/products')
+
+    assert first is second
+    assert len(messenger.session.calls) == 1
+    assert messenger.cache.stats['hits'] == 1
+
+    messenger.cache.invalidate('/products')
+    assert messenger.get('/products') == []
+
+
+def test_messenger_batch():
+    def call(n):
+        def wrapped():
+            if n == 3:
+                raise ValueError(n)
+            time.sleep(0.01 * (5 - n))
+            return n
+        return wrapped
+
+    messenger = cbpro.messenger.Messenger()
+    results = messenger.batch([call(n) for n in range(5)], workers=5)
+
+    assert results[:3] == [0, 1, 2]
+    assert isinstance(results[3], ValueError)
+    assert results[4] == 4
+    assert messenger.batch([]) == []
+
+
+@pytest.mark.parametrize('workers', [0, -1])
+def test_messenger_batch_serial(workers):
+    messenger = cbpro.messenger.Messenger()
+    reports = []
+
+    results = messenger.batch([threading.get_ident, lambda: 1 / 0], workers=workers,
+                              progress=lambda done, total: reports.append((done, total)))
+
+    assert results[0] == threading.get_ident()
+    assert isinstance(results[1], ZeroDivisionError)
+    assert reports == [(1, 2), (2, 2)]
+    assert messenger.executors == {}
+
+
+def dummy_pages(count: int) -> list:
+    responses = []
+    for n in range(count, 0, -1):
+        response = DummyResponse(200, [{'trade_id': n}])
+        if n > 1:
+            response.headers['CB-AFTER'] = str(n)
+        responses.append(response)
+    return responses
+
+
+@pytest.mark.parametrize('prefetch', [0, 1, 3])
+def test_messenger_paginate_prefetch(prefetch):
+    messenger = dummy_messenger(dummy_pages(5))
+
+    response = messenger.paginate('/fills', prefetch=prefetch)
+
+    assert inspect.isgenerator(response)
+    assert [r['trade_id'] for r in response] == [5, 4, 3, 2, 1]
+
+
+def test_messenger_pages_batch():
+    messenger = dummy_messenger(dummy_pages(3))
+    params = dict()
+
+    pages = list(messenger.pages('/fills', params=params, prefetch=2))
+
+    assert pages == [[{'trade_id': 3}], [{'trade_id': 2}], [{'trade_id': 1}]]
+    assert params['limit'] == 100
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_messenger_paginate_error(prefetch):
+    error = DummyResponse(400, {'message': 'Invalid limit'})
+    messenger = dummy_messenger(dummy_pages(3)[:1] + [error])
+
+    response = messenger.paginate('/fills', prefetch=prefetch)
+    first = next(response)
+    with pytest.raises(cbpro.messenger.ResponseError) as raised:
+        next(response)
+
+    assert first == {'trade_id': 3}
+    assert raised.value.response == {'message': 'Invalid limit'}
+
+
+def test_messenger_pages_early_exit():
+    messenger = dummy_messenger(dummy_pages(50))
+
+    pages = messenger.pages('/fills', prefetch=2)
+    first = next(pages)
+    pages.close()
+
+    assert first == [{'trade_id': 50}]
+    # the worker is bounded by the look-ahead, not the full history
+    assert len(messenger.session.calls) <= 5
+
+
+def test_messenger_pool():
+    pool = cbpro.messenger.Pool(connections=2, maxsize=32)
+    messenger = cbpro.messenger.Messenger(pool=pool)
+    adapter = messenger.session.get_adapter(messenger.url)
+
+    assert isinstance(adapter, cbpro.messenger.Adapter)
+    assert adapter._pool_maxsize == 32
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in adapter.socket_options
+    assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) in adapter.socket_options
+
+
+def test_messenger_pool_local():
+    pool = cbpro.messenger.Pool(local=True)
+    messenger = cbpro.messenger.Messenger(pool=pool)
+    sessions = []
+    done = threading.Event()
+
+    def work():
+        sessions.append(messenger.session)
+        done.wait()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    while not sessions:
+        thread.join(0.001)
+
+    assert messenger.session is messenger.session
+    assert messenger.session is not sessions[0]
+    done.set()
+    thread.join()
+
+
+def test_messenger_pool_local_reuse():
+    pool = cbpro.messenger.Pool(local=True)
+    messenger = cbpro.messenger.Messenger(pool=pool)
+    sessions = []
+
+    for _ in range(3):
+        thread = threading.Thread(target=lambda: sessions.append(messenger.session))
+        thread.start()
+        thread.join()
+    session = sessions[0]
+    closed = []
+    session.close = lambda: closed.append(session)
+    messenger.close()
+
+    # the session of a finished thread is handed to the next one
+    assert sessions == [session] * 3
+    assert closed == [session]
+    assert messenger.sessions == {}
+
+
+def test_messenger_batch_reuses_threads():
+    messenger = cbpro.messenger.Messenger()
+
+    first = set(messenger.batch([threading.get_ident] * 8, workers=2))
+    second = set(messenger.batch([threading.get_ident] * 8, workers=2))
+    messenger.close()
+
+    assert len(first | second) <= 2
+    assert messenger.executors == {}
+
+
+def test_messenger_batch_nested():
+    messenger = cbpro.messenger.Messenger()
+
+    def inner(index):
+        return sum(messenger.batch([lambda: index] * 4, workers=2))
+
+    calls = [functools.partial(inner, index) for index in range(4)]
+    pool = concurrent.futures.ThreadPoolExecutor(1)
+    future = pool.submit(messenger.batch, calls, 2)
+    try:
+        results = future.result(timeout=10)
+    finally:
+        messenger.close()
+        pool.shutdown(wait=False)
+
+    assert results == [0, 4, 8, 12]
+
+
+def test_messenger_warmup_unreachable():
+    messenger = cbpro.messenger.Messenger(url='http://127.0.0.1:9', timeout=1)
+    assert messenger.warmup() is False
+
+
 class DummySubscriber(cbpro.messenger.Subscriber):
     pass
 
@@ -0,0 +1,618 @@
+from decimal import Decimal
+
+import pytest
+import threading
+
+import cbpro.limiter
+import cbpro.order_book
+
+
+def get_snapshot(sequence: int = 10) -> dict:
+    return {
+        'sequence': sequence,
+        'bids': [['99.00', '1.0', 'b1'], ['99.00', '2.0', 'b2'], ['98.00', '1.5', 'b3']],
+        'asks': [['101.00', '1.0', 'a1'], ['102.00', '3.0', 'a2']]
+    }
+
+
+class DummyProducts(object):
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = None
+        self.sequence = 10
+
+    def order_book(self, product_id: str, params: dict = None) -> dict:
+        # NOTE: Blocks until `release` is set, like a slow download
+        if self.release is not None:
+            self.release.wait()
+        self.calls += 1
+        return get_snapshot(self.sequence)
+
+
+class DummyClient(object):
+    def __init__(self) -> None:
+        self.products = DummyProducts()
+
+
+def sync(book: cbpro.order_book.OrderBook) -> cbpro.order_book.OrderBook:
+    # NOTE: The next message after the snapshot arrives replays the buffer
+    book.on_response({'type': 'heartbeat', 'sequence': 9})
+    book._ready.wait()
+    book.on_response({'type': 'heartbeat', 'sequence': 10})
+    return book
+
+
+def get_book() -> cbpro.order_book.OrderBook:
+    return sync(cbpro.order_book.OrderBook('BTC-USD', client=DummyClient()))
+
+
+def test_order_book_reset():
+    book = get_book()
+
+    assert book._client.products.calls == 1
+    assert book.get_bid() == Decimal('99.00')
+    assert book.get_ask() == Decimal('101.00')
+    assert [o['id'] for o in book.get_bids(Decimal('99.00'))] == ['b1', 'b2']
+    assert book.get_message()['channels'] == ['full']
+
+
+def test_order_book_messages():
+    # arrange
+    book = get_book()
+
+    # act
+    book.on_response({'type': 'open', 'sequence': 11, 'order_id': 'b4', 'side': 'buy',
+                      'price': '99.00', 'remaining_size': '0.5'})
+    book.on_response({'type': 'match', 'sequence': 12, 'maker_order_id': 'b1', 'side': 'buy',
+                      'price': '99.00', 'size': '0.25'})
+    book.on_response({'type': 'change', 'sequence': 13, 'order_id': 'b2', 'side': 'buy',
+                      'price': '99.00', 'new_size': '1.0'})
+    book.on_response({'type': 'done', 'sequence': 14, 'order_id': 'a1', 'side': 'sell',
+                      'price': '101.00'})
+
+    # assert
+    bids = book.get_bids(Decimal('99.00'))
+    assert [(o['id'], o['size']) for o in bids] == [
+        ('b1', Decimal('0.75')), ('b2', Decimal('1.0')), ('b4', Decimal('0.5'))
+    ]
+    assert book.get_ask() == Decimal('102.00')
+    assert book.get_order('a1') is None
+    assert book.get_current_ticker()['maker_order_id'] == 'b1'
+    assert book.get_current_book()['sequence'] == 14
+
+
+def test_order_book_match_fills_maker():
+    # arrange
+    book = get_book()
+
+    # act
+    book.on_response({'type': 'match', 'sequence': 11, 'maker_order_id': 'a1', 'side': 'sell',
+                      'price': '101.00', 'size': '1.0'})
+    book.on_response({'type': 'done', 'sequence': 12, 'order_id': 'a1', 'side': 'sell',
+                      'price': '101.00'})
+
+    # assert
+    assert book.get_ask() == Decimal('102.00')
+    assert book.get_asks(Decimal('101.00')) is None
+
+
+def test_order_book_sequence_gap():
+    # arrange
+    book = get_book()
+    book._client.products.release = threading.Event()
+    book._client.products.sequence = 16
+
+    # act
+    book.on_response({'type': 'open', 'sequence': 5, 'order_id': 'x', 'side': 'buy',
+                      'price': '90.00', 'remaining_size': '1.0'})
+    for sequence in (15, 16, 17, 18):
+        # NOTE: Buffered while the snapshot downloads; 17 and 18 come after it
+        book.on_response({'type': 'open', 'sequence': sequence, 'order_id': f'z{sequence}',
+                          'side': 'sell', 'price': '105.00', 'remaining_size': '1.0'})
+    buffered = len(book._buffer)
+    book._client.products.release.set()
+    book._ready.wait()
+    book.on_response({'type': 'heartbeat', 'sequence': 18})
+
+    # assert
+    assert buffered == 4
+    assert book._client.products.calls == 2
+    assert book.get_order('x') is None
+    assert book.get_order('z16') is None
+    assert book.get_order('z17')['price'] == Decimal('105.00')
+    assert book.get_order('z18') is not None
+    assert book._sequence == 18
+    assert book._buffer is None
+
+
+class DummyBackoff(cbpro.limiter.Backoff):
+    def __init__(self) -> None:
+        super(DummyBackoff, self).__init__()
+        self.waits = []
+
+    def wait(self, attempt: int, after: float = None) -> float:
+        self.waits.append(attempt)
+        return 0
+
+
+def test_order_book_snapshot_error():
+    # arrange
+    backoff = DummyBackoff()
+    book = cbpro.order_book.OrderBook('BTC-USD', client=DummyClient(), backoff=backoff)
+    errors = []
+    book.on_error = errors.append
+    book._client.products.order_book = lambda *args: 1 / 0
+
+    # act
+    book.on_response({'type': 'heartbeat', 'sequence': 9})
+    book._ready.wait()
+    book._client.products = DummyProducts()
+    book.on_response({'type': 'heartbeat', 'sequence': 10})
+    book._ready.wait()
+    book.on_response({'type': 'heartbeat', 'sequence': 11})
+
+    # assert
+    assert len(errors) == 1
+    assert backoff.waits == [0]
+    assert book._attempt == 0
+    assert book._buffer is None
+    assert book.get_bid() == Decimal('99.00')
+
+
+def test_order_book_buffer_overflow():
+    # arrange
+    client = DummyClient()
+    client.products.release = threading.Event()
+    book = cbpro.order_book.OrderBook('BTC-USD', client=client, maxbuffer=3)
+
+    # act
+    for sequence in range(9, 13):
+        book.on_response({'type': 'heartbeat', 'sequence': sequence})
+    overflow = (list(book._buffer), book._overflow)
+    client.products.release.set()
+    book._ready.wait()
+    client.products.sequence = 12
+    book.on_response({'type': 'heartbeat', 'sequence': 13})
+    book._ready.wait()
+    book.on_response({'type': 'heartbeat', 'sequence': 14})
+
+    # assert
+    assert [m['sequence'] for m in overflow[0]] == [12]
+    assert overflow[1] is True
+    assert client.products.calls == 2
+    assert book._buffer is None
+    assert book._sequence == 14
+
+
+class DummyFixedProducts(DummyProducts):
+    def get(self, product_id: str) -> dict:
+        return {'id': product_id, 'quote_increment': '0.01000000', 'base_increment': '0.00000001'}
+
+
+def test_order_book_fixed():
+    # arrange
+    client = DummyClient()
+    client.products = DummyFixedProducts()
+    book = sync(cbpro.order_book.OrderBook('BTC-USD', client=client, fixed=True))
+
+    # act
+    book.on_response({'type': 'match', 'sequence': 11, 'maker_order_id': 'b1', 'side': 'buy',
+                      'price': '99.00', 'size': '0.25000000'})
+
+    # assert
+    assert book._bids.peekitem(-1)[0] == 9900
+    assert book._orders['b1']['size'] == 75000000
+    assert book.get_bid() == Decimal('99.00')
+    assert book.get_order('b1')['size'] == Decimal('0.75')
+    assert book.get_bids(Decimal('99.00'))[1]['id'] == 'b2'
+    assert book.get_bids(Decimal('99.005')) is None
+    assert book.get_asks('101.001') is None
+    assert book.get_current_book()['asks'][0] == [Decimal('101.00'), Decimal('1.0'), 'a1']
+
+
+def test_order_books_routing():
+    # arrange
+    books = cbpro.order_book.OrderBooks(['BTC-USD', 'ETH-USD'], client=DummyClient(), workers=2)
+    message = {'type': 'open', 'sequence': 11, 'order_id': 'e1', 'side': 'buy',
+               'price': '100.00', 'remaining_size': '1.0'}
+
+    # act
+    for product_id in ('BTC-USD', 'ETH-USD'):
+        books.on_response({'type': 'heartbeat', 'product_id': product_id, 'sequence': 9})
+        books[product_id]._ready.wait()
+        books.on_response({'type': 'heartbeat', 'product_id': product_id, 'sequence': 10})
+    books.on_response(dict(message, product_id='ETH-USD'))
+    books.on_response({'type': 'subscriptions', 'channels': []})
+    books.on_stop()
+
+    # assert
+    assert len(books) == 2
+    assert books.get_message()['product_ids'] == ['BTC-USD', 'ETH-USD']
+    assert books['ETH-USD'].get_bid() == Decimal('100.00')
+    assert books['BTC-USD'].get_bid() == Decimal('99.00')
+    assert books['ETH-USD']._sequence == 11
+    assert books['BTC-USD']._sequence == 10
+
+
+def test_order_books_restart():
+    # arrange
+    books = cbpro.order_book.OrderBooks(['BTC-USD'], client=DummyClient(), workers=1)
+    books.on_stop()
+
+    # act
+    books.on_start()
+    books.on_response({'type': 'heartbeat', 'product_id': 'BTC-USD', 'sequence': 9})
+    books['BTC-USD']._ready.wait()
+    books.on_response({'type': 'heartbeat', 'product_id': 'BTC-USD', 'sequence': 10})
+    executor = books['BTC-USD']._executor
+    books.on_stop()
+
+    # assert
+    assert executor is not None
+    assert books['BTC-USD']._executor is None
+    assert books['BTC-USD'].get_bid() == Decimal('99.00')
+
+
+def test_order_book_aggregates():
+    # arrange
+    book = get_book()
+
+    # act
+    book.on_response({'type': 'match', 'sequence': 11, 'maker_order_id': 'b1', 'side': 'buy',
+                      'price': '99.00', 'size': '0.5'})
+    book.on_response({'type': 'change', 'sequence': 12, 'order_id': 'b2', 'side': 'buy',
+                      'price': '99.00', 'new_size': '1.5'})
+    book.on_response({'type': 'open', 'sequence': 13, 'order_id': 'a3', 'side': 'sell',
+                      'price': '101.00', 'remaining_size': '2.0'})
+
+    # assert
+    assert book.get_best_bid() == [Decimal('99.00'), Decimal('2.0')]
+    assert book.get_best_ask() == [Decimal('101.00'), Decimal('3.0')]
+    assert book.get_spread() == Decimal('2.00')
+    assert book.get_ladder(1) == {
+        'sequence': 13,
+        'bids': [[Decimal('99.00'), Decimal('2.0'), 2]],
+        'asks': [[Decimal('101.00'), Decimal('3.0'), 2]]
+    }
+    assert len(book.get_ladder()['bids']) == 2
+
+
+def test_order_book_cost():
+    book = get_book()
+
+    assert book.get_cost('buy', '4.0') == [Decimal('4.0'), Decimal('407.00')]
+    assert book.get_vwap('buy', '4.0') == Decimal('101.75')
+    assert book.get_cost('sell', '10') == [Decimal('4.5'), Decimal('444.00')]
+    assert book.get_vwap('sell', '0') is None
+
+
+def test_order_book_cost_fixed():
+    client = DummyClient()
+    client.products = DummyFixedProducts()
+    book = sync(cbpro.order_book.OrderBook('BTC-USD', client=client, fixed=True))
+
+    assert book.get_cost('buy', Decimal('4.0')) == [Decimal('4.0'), Decimal('407.00')]
+    assert book.get_vwap('buy', '4.0') == Decimal('101.75')
+    assert book.get_best_bid() == [Decimal('99.00'), Decimal('3.0')]
+    # finer than the base increment of 0.00000001
+    assert book.get_cost('buy', '0.123456789') == [Decimal('0.12345678'), Decimal('12.4691347800')]
+
+
+def get_level2_snapshot(product_id: str = 'BTC-USD') -> dict:
+    return {
+        'type': 'snapshot',
+        'product_id': product_id,
+        'bids': [['99.00', '3.0'], ['98.00', '1.5']],
+        'asks': [['101.00', '1.0'], ['102.00', '3.0']]
+    }
+
+
+def test_level2_book():
+    # arrange
+    book = cbpro.order_book.Level2Book('BTC-USD')
+
+    # act
+    book.on_response({'type': 'l2update', 'changes': [['buy', '100.00', '9.0']]})
+    book.on_response(get_level2_snapshot())
+    book.on_response({'type': 'l2update', 'product_id': 'BTC-USD',
+                      'changes': [['sell', '101.00', '0'], ['buy', '99.50', '2.0']]})
+
+    # assert
+    assert book.get_best_bid() == [Decimal('99.50'), Decimal('2.0')]
+    assert book.get_best_ask() == [Decimal('102.00'), Decimal('3.0')]
+    assert book.get_ladder(2)['bids'] == [[Decimal('99.50'), Decimal('2.0'), None],
+                                          [Decimal('99.00'), Decimal('3.0'), None]]
+    assert book.get_cost('sell', '4') == [Decimal('4'), Decimal('397.00')]
+    assert book.get_current_book()['sequence'] == 1
+    assert book.get_message()['channels'] == ['level2']
+
+
+def test_level2_book_fixed():
+    client = DummyClient()
+    client.products = DummyFixedProducts()
+    book = cbpro.order_book.Level2Book('BTC-USD', client=client, fixed=True)
+
+    book.on_response(get_level2_snapshot())
+
+    assert book._bids.peekitem(-1) == (9900, 300000000)
+    assert book.get_vwap('buy', '2') == Decimal('101.5')
+
+
+class DummyListingProducts(DummyProducts):
+    def list(self) -> list:
+        return [{'id': product_id, 'quote_increment': '0.01', 'base_increment': '0.001'}
+                for product_id in ('BTC-USD', 'ETH-USD')]
+
+    def get(self, product_id: str) -> dict:
+        raise AssertionError('increments are loaded with the listing')
+
+
+def test_level2_book_fixed_resolved_up_front():
+    # arrange
+    client = DummyClient()
+    client.products = DummyFixedProducts()
+    book = cbpro.order_book.Level2Book('BTC-USD', client=client, fixed=True)
+    listing = DummyClient()
+    listing.products = client.products = DummyListingProducts()
+
+    # act
+    book.on_response(get_level2_snapshot())
+    books = cbpro.order_book.OrderBooks(['BTC-USD', 'ETH-USD'], client=listing, fixed=True, level=2)
+    books.on_response(get_level2_snapshot('ETH-USD'))
+
+    # assert
+    assert book.get_bid() == Decimal('99.00')
+    assert books['ETH-USD']._bids.peekitem(-1) == (9900, 3000)
+
+
+def test_order_books_level2():
+    books = cbpro.order_book.OrderBooks(['BTC-USD', 'ETH-USD'], client=DummyClient(), level=2)
+
+    books.on_response(get_level2_snapshot('ETH-USD'))
+    books.on_stop()
+
+    assert books.get_message()['channels'] == ['level2']
+    assert isinstance(books['BTC-USD'], cbpro.order_book.Level2Book)
+    assert books['ETH-USD'].get_bid() == Decimal('99.00')
+    assert books['BTC-USD'].get_best_bid() is None
+
+
+def test_order_book_changes():
+    # arrange
+    book = cbpro.order_book.OrderBook('BTC-USD', client=DummyClient(), changelog=3)
+    sync(book)
+
+    # act
+    book.on_response({'type': 'match', 'sequence': 11, 'maker_order_id': 'b1', 'side': 'buy',
+                      'price': '99.00', 'size': '0.5'})
+    book.on_response({'type': 'done', 'sequence': 12, 'order_id': 'a1', 'side': 'sell',
+                      'price': '101.00'})
+    since_11 = book.get_changes(11)
+    since_10 = book.get_changes(10)
+    book.on_response({'type': 'open', 'sequence': 13, 'order_id': 'b4', 'side': 'buy',
+                      'price': '99.00', 'remaining_size': '1.0'})
+    book.on_response({'type': 'open', 'sequence': 14, 'order_id': 'b5', 'side': 'buy',
+                      'price': '97.00', 'remaining_size': '1.0'})
+
+    # assert
+    assert since_11 == {'sequence': 12, 'bids': [], 'asks': [[Decimal('101.00'), 0]]}
+    assert since_10['bids'] == [[Decimal('99.00'), Decimal('2.5')]]
+    assert book.get_changes(9) is None
+    assert book.get_changes(10) is None
+    assert book.get_changes(12)['bids'] == [[Decimal('97.00'), Decimal('1.0')],
+                                            [Decimal('99.00'), Decimal('3.5')]]
+
+
+def test_level2_book_changes():
+    book = cbpro.order_book.Level2Book('BTC-USD')
+    book.on_response(get_level2_snapshot())
+
+    book.on_response({'type': 'l2update', 'changes': [['buy', '99.00', '1.0'], ['sell', '102.00', '0']]})
+    book.on_response({'type': 'l2update', 'changes': [['buy', '99.00', '2.0']]})
+
+    assert book.get_changes(0) == {'sequence': 2,
+                                   'bids': [[Decimal('99.00'), Decimal('2.0')]],
+                                   'asks': [[Decimal('102.00'), 0]]}
+    assert book.get_changes(2)['bids'] == []
+    assert book.get_changes(-1) is None
+
+
+def test_level2_book_changes_after_snapshot():
+    # arrange
+    book = cbpro.order_book.Level2Book('BTC-USD')
+    book.on_response(get_level2_snapshot())
+    for _ in range(5):
+        book.on_response({'type': 'l2update', 'changes': [['buy', '99.00', '1.0']]})
+    since = book.get_changes(0)['sequence']
+
+    # act
+    book.on_start()
+    book.on_response({'type': 'l2update', 'changes': [['buy', '97.00', '1.0']]})
+    book.on_response(get_level2_snapshot())
+    book.on_response({'type': 'l2update', 'changes': [['sell', '101.00', '2.0']]})
+
+    # assert
+    assert since == 5
+    assert book.get_changes(since) is None
+    assert book.get_changes(6) == {'sequence': 7, 'bids': [],
+                                   'asks': [[Decimal('101.00'), Decimal('2.0')]]}
+    assert book.get_bid() == Decimal('99.00')
+
+
+def test_order_book_arrays():
+    # arrange
+    np = pytest.importorskip('numpy')
+    client = DummyClient()
+    client.products = DummyFixedProducts()
+    book = sync(cbpro.order_book.OrderBook('BTC-USD', client=client, fixed=True))
+
+    # act
+    arrays = book.get_arrays(3)
+    bid_price = arrays['bid_price']
+    book.on_response({'type': 'done', 'sequence': 11, 'order_id': 'b3', 'side': 'buy',
+                      'price': '98.00'})
+    again = book.get_arrays(out=arrays)
+
+    # assert
+    assert again['bid_price'] is bid_price
+    assert again['sequence'] == 11
+    assert bid_price[0] == 99.0
+    assert np.isnan(bid_price[1])
+    assert list(again['bid_size'][:1]) == [3.0]
+    assert list(again['bid_count'][:1]) == [2.0]
+    assert list(again['ask_price'][:2]) == [101.0, 102.0]
+    assert np.isnan(again['ask_size'][2])
+
+
+def test_level2_book_arrays():
+    pytest.importorskip('numpy')
+    book = cbpro.order_book.Level2Book('BTC-USD')
+    book.on_response(get_level2_snapshot())
+
+    arrays = book.get_arrays()
+
+    assert len(arrays['bid_price']) == 2
+    assert list(arrays['ask_size']) == [1.0, 3.0]
+
+
+def test_order_book_consistent_reads():
+    # arrange
+    book = get_book()
+    done = threading.Event()
+    errors = []
+
+    def write() -> None:
+        sequence = 10
+        for n in range(2000):
+            for message in ({'type': 'open', 'order_id': f'x{n}', 'side': 'buy',
+                             'price': '99.00', 'remaining_size': '0.5'},
+                            {'type': 'done', 'order_id': f'x{n}', 'side': 'buy',
+                             'price': '99.00'}):
+                sequence += 1
+                book.on_response(dict(message, sequence=sequence))
+        done.set()
+
+    def check() -> None:
+        while not done.is_set():
+            ladder, current = book.read(lambda: (book.get_ladder(), book.get_current_book()))
+            sizes = dict()
+            for price, size, _ in current['bids']:
+                sizes[price] = sizes.get(price, 0) + size
+            if ladder['sequence'] != current['sequence']:
+                errors.append(ladder['sequence'])
+            if {price: size for price, size, _ in ladder['bids']} != sizes:
+                errors.append(ladder)
+
+    # act
+    readers = [threading.Thread(target=check) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    write()
+    for reader in readers:
+        reader.join()
+
+    # assert
+    assert errors == []
+    assert book.get_ladder()['sequence'] == 4010
+
+
+def test_order_book_read_falls_back_to_lock():
+    # arrange
+    book = get_book()
+    book._writer = -1
+    book._version += 1
+    results = []
+
+    # act
+    reader = threading.Thread(target=lambda: results.append(book.get_bid()))
+    reader.start()
+    while not book._lock.locked():
+        reader.join(0.001)
+    # NOTE: The message in flight finishes; the next one would wait for the lock
+    assert book._waiting
+    book._version += 1
+    reader.join()
+
+    # assert
+    assert results == [Decimal('99.00')]
+    assert not book._waiting
+    assert not book._lock.locked()
+
+
+def test_order_book_nested_read_under_lock():
+    # arrange
+    book = get_book()
+    book._writer = -1
+    book._backoff.retries = 1
+    book._version += 1
+    runs = []
+    results = []
+
+    def call() -> Decimal:
+        if not runs and book._lock.locked():
+            # NOTE: A message that started before the reader asked for the lock
+            book._version += 1
+            runs.append(book._version)
+        return book.get_bid()
+
+    # act
+    reader = threading.Thread(target=lambda: results.append(book.read(call)), daemon=True)
+    reader.start()
+    while not book._lock.locked():
+        reader.join(0.001)
+    book._version += 1
+    while not runs:
+        reader.join(0.001)
+    book._version += 1
+    reader.join(5)
+
+    # assert
+    assert not reader.is_alive()
+    assert results == [Decimal('99.00')]
+    assert not book._readers.locked()
+
+
+def test_order_book_reads_stay_on_reader_threads():
+    # arrange
+    book = get_book()
+    book._backoff.retries = 1
+    done = threading.Event()
+    threads = set()
+
+    def call() -> dict:
+        threads.add(threading.get_ident())
+        return book.get_current_book()
+
+    def write() -> None:
+        sequence = 10
+        for n in range(1000):
+            for message in ({'type': 'open', 'order_id': f'x{n}', 'side': 'buy',
+                             'price': '99.00', 'remaining_size': '0.5'},
+                            {'type': 'done', 'order_id': f'x{n}', 'side': 'buy',
+                             'price': '99.00'}):
+                sequence += 1
+                book.on_response(dict(message, sequence=sequence))
+        done.set()
+
+    def check() -> None:
+        while not done.is_set():
+            book.read(call)
+
+    # act
+    readers = [threading.Thread(target=check) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    writer = threading.Thread(target=write)
+    writer.start()
+    writer.join()
+    for reader in readers:
+        reader.join()
+
+    # assert
+    assert writer.ident not in threads
+    assert threads <= {reader.ident for reader in readers}
+
+
+def test_book_is_abstract():
+    with pytest.raises(TypeError):
+        cbpro.order_book.Book()
@@ -1,4 +1,5 @@
 from itertools import islice
+from iso8601 import parse_date
 from dateutil.relativedelta import relativedelta
 from tests.unit.utils import Teardown
 
@@ -8,6 +9,7 @@ import inspect
 
 import cbpro.messenger
 import cbpro.public
+import cbpro.store
 
 
 class TestPublicClient(object):
@@ -168,3 +170,253 @@ class TestPublicHistory(Teardown):
         assert len(response) == n_days
         assert len(response[0]) == 6
 
+
+
+class DummyMessenger(cbpro.messenger.Messenger):
+    calls = 0
+
+    def get(self, endpoint: str, params: dict = None) -> list:
+        self.calls += 1
+        if isinstance(params['start'], str):
+            params = dict(params, start=parse_date(params['start']), end=parse_date(params['end']))
+        start = int(params['start'].timestamp())
+        end = int(params['end'].timestamp())
+        granularity = params['granularity']
+        return [
+            [t, 1.0, 2.0, 1.0, 2.0, 10.0]
+            for t in range(end, start - 1, -granularity)
+        ]
+
+
+def test_history_plan():
+    # arrange
+    history = cbpro.public.History(DummyMessenger())
+    params = {"start": "2021-01-01T00:00:30+00:00", "end": "2021-01-01T10:00:00+00:00", "granularity": 60}
+
+    # act
+    plan = history.plan("BTC-USD", params)
+
+    # assert
+    starts = [parse_date(loop_params["start"]) for _, loop_params in plan]
+    ends = [parse_date(loop_params["end"]) for _, loop_params in plan]
+    assert len(plan) == 2
+    assert starts[0] == parse_date("2021-01-01T00:01:00+00:00")
+    assert ends[0] - starts[0] == datetime.timedelta(minutes=299)
+    assert starts[1] - ends[0] == datetime.timedelta(minutes=1)
+    assert ends[1] == parse_date(params["end"])
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_history_candles_offline(workers):
+    # arrange
+    history = cbpro.public.History(DummyMessenger())
+    tzinfo = datetime.timezone.utc
+    end = datetime.datetime(2021, 1, 1, tzinfo=tzinfo)
+    start = end - datetime.timedelta(days=700)
+    params = {"start": start.isoformat(), "end": end.isoformat(), "granularity": 86400}
+    reports = []
+
+    # act
+    response = history.candles("BTC-USD", params, workers=workers,
+                               progress=lambda done, total: reports.append((done, total)))
+
+    # assert
+    times = [candle[0] for candle in response]
+    assert times == sorted(set(times))
+    assert len(response) == 701
+    assert reports[-1] == (3, 3)
+
+
+def test_history_candles_store():
+    # arrange
+    messenger = DummyMessenger()
+    history = cbpro.public.History(messenger, store=cbpro.store.CandleStore())
+    tzinfo = datetime.timezone.utc
+    end = datetime.datetime(2021, 1, 1, tzinfo=tzinfo)
+    params = {"start": (end - datetime.timedelta(days=100)).isoformat(),
+              "end": end.isoformat(), "granularity": 86400}
+    wider = dict(params, start=(end - datetime.timedelta(days=400)).isoformat())
+
+    # act
+    first = history.candles("BTC-USD", params)
+    calls = messenger.calls
+    again = history.candles("BTC-USD", params)
+    second = history.candles("BTC-USD", wider)
+
+    # assert
+    assert len(first) == 101
+    assert again == first
+    assert calls == 1
+    assert messenger.calls == 2  # only the uncovered 300 days
+    assert len(second) == 401
+
+
+def test_history_candles_columnar():
+    # arrange
+    pytest.importorskip('numpy')
+    history = cbpro.public.History(DummyMessenger())
+    tzinfo = datetime.timezone.utc
+    end = datetime.datetime(2021, 1, 1, tzinfo=tzinfo)
+    params = {"start": (end - datetime.timedelta(days=400)).isoformat(),
+              "end": end.isoformat(), "granularity": 86400}
+
+    # act
+    response = history.candles("BTC-USD", params, workers=2, columnar=True)
+
+    # assert
+    assert len(response) == 401
+    assert response['time'][0] < response['time'][-1]
+
+
+@pytest.mark.parametrize('workers', [None, 0, 3])
+def test_history_stream(workers):
+    # arrange
+    history = cbpro.public.History(DummyMessenger())
+    tzinfo = datetime.timezone.utc
+    end = datetime.datetime(2021, 1, 1, tzinfo=tzinfo)
+    params = {"start": (end - datetime.timedelta(days=1000)).isoformat(),
+              "end": end.isoformat(), "granularity": 86400}
+
+    # act
+    response = history.stream("BTC-USD", params, workers=workers)
+    first = next(response)
+    chunks = [first] + list(response)
+
+    # assert
+    assert inspect.isgenerator(response)
+    times = [candle[0] for chunk in chunks for candle in chunk]
+    assert len(chunks) == 4
+    assert times == sorted(set(times))
+    assert len(times) == 1001
+
+
+class DummyErrorMessenger(DummyMessenger):
+    # NOTE: Every request after the first fails
+    def get(self, endpoint: str, params: dict = None) -> list:
+        if self.calls:
+            return {'message': 'Internal server error'}
+        return super(DummyErrorMessenger, self).get(endpoint, params)
+
+
+def test_history_stream_error():
+    # arrange
+    history = cbpro.public.History(DummyErrorMessenger())
+    tzinfo = datetime.timezone.utc
+    end = datetime.datetime(2021, 1, 1, tzinfo=tzinfo)
+    params = {"start": (end - datetime.timedelta(days=1000)).isoformat(),
+              "end": end.isoformat(), "granularity": 86400}
+    chunks = []
+
+    # act
+    with pytest.raises(cbpro.messenger.ResponseError) as error:
+        for chunk in history.stream("BTC-USD", params):
+            chunks.append(chunk)
+
+    # assert
+    assert len(chunks) == 1
+    assert error.value.response == {'message': 'Internal server error'}
+
+
+class DummyTradesMessenger(cbpro.messenger.Messenger):
+    # NOTE:
+    #   - Trade ids 1 to 5000, one trade per second from 2021-01-01
+    #   - Like the API, pages hold at most 100 trades whatever the limit
+    calls = 0
+    origin = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def get(self, endpoint: str, params: dict = None) -> list:
+        self.calls += 1
+        after = params.get('after', 5001)
+        limit = min(params.get('limit', 100), 100)
+        return [
+            {'trade_id': i, 'time': (self.origin + datetime.timedelta(seconds=i)).isoformat(),
+             'price': '100.00', 'size': '0.1', 'side': 'buy'}
+            for i in range(after - 1, max(0, after - 1 - limit), -1)
+        ]
+
+
+def test_backfill_plan():
+    # arrange
+    backfill = cbpro.public.Backfill(DummyTradesMessenger())
+
+    # act
+    plan = backfill.plan('BTC-USD', 1, 2500)
+
+    # assert
+    assert [params['after'] for _, params in plan] == [1001, 2001, 2501]
+    assert [params['limit'] for _, params in plan] == [1000, 1000, 500]
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_backfill_trades(workers):
+    # arrange
+    messenger = DummyTradesMessenger()
+    backfill = cbpro.public.Backfill(messenger)
+    reports = []
+
+    # act
+    trades = backfill.trades('BTC-USD', 10, 3009, workers=workers,
+                             progress=lambda done, total: reports.append((done, total)))
+
+    # assert
+    assert [trade['trade_id'] for trade in trades] == list(range(10, 3010))
+    assert messenger.calls == 30
+    assert reports[-1] == (3, 3)
+
+
+@pytest.mark.parametrize('workers', [None, 0, 2])
+def test_backfill_stream(workers):
+    # arrange
+    backfill = cbpro.public.Backfill(DummyTradesMessenger())
+
+    # act
+    chunks = list(backfill.stream('BTC-USD', 500, 2700, workers=workers))
+
+    # assert
+    ids = [trade['trade_id'] for chunk in chunks for trade in chunk]
+    assert len(chunks) == 3
+    assert ids == list(range(500, 2701))
+
+
+def test_backfill_between():
+    # arrange
+    backfill = cbpro.public.Backfill(DummyTradesMessenger())
+    origin = DummyTradesMessenger.origin
+
+    # act
+    first = backfill.search('BTC-USD', (origin + datetime.timedelta(seconds=1234)).isoformat())
+    trades = backfill.between('BTC-USD',
+                              (origin + datetime.timedelta(seconds=100)).isoformat(),
+                              (origin + datetime.timedelta(seconds=1600)).isoformat(),
+                              workers=2)
+
+    # assert
+    assert first == 1234
+    assert [trade['trade_id'] for trade in trades] == list(range(100, 1600))
+
+
+class DummyEmptyMessenger(cbpro.messenger.Messenger):
+    def get(self, endpoint: str, params: dict = None) -> list:
+        if 'after' in params:
+            return {'message': 'Internal server error'}
+        return []
+
+
+def test_backfill_errors():
+    # arrange
+    backfill = cbpro.public.Backfill(DummyEmptyMessenger())
+    when = DummyTradesMessenger.origin.isoformat()
+
+    # act
+    latest = backfill.latest('BTC-USD')
+    between = backfill.between('BTC-USD', when, when)
+    search = backfill.search('BTC-USD', when)
+    error = backfill.trades('BTC-USD', 1, 2)
+
+    # assert
+    assert latest is None
+    assert between == []
+    assert search is None
+    assert error == {'message': 'Internal server error'}
+    with pytest.raises(cbpro.messenger.ResponseError):
+        backfill.search('BTC-USD', when, last=4)
@@ -0,0 +1,42 @@
+import time
+
+import cbpro.store
+
+
+def candles(start: int, end: int, granularity: int) -> list:
+    return [
+        [t, 1.0, 2.0, 1.0, 2.0, 10.0]
+        for t in range(end, start - 1, -granularity)
+    ]
+
+
+def test_store_insert_covered():
+    store = cbpro.store.CandleStore()
+
+    assert store.covered('BTC-USD', 60) == []
+
+    store.insert('BTC-USD', 60, candles(0, 300, 60), 0, 300)
+    assert store.covered('BTC-USD', 60) == [(0, 300)]
+    assert store.covered('BTC-USD', 300) == []
+
+    store.insert('BTC-USD', 60, candles(360, 600, 60), 360, 600)
+    assert store.covered('BTC-USD', 60) == [(0, 600)]
+
+
+def test_store_select():
+    store = cbpro.store.CandleStore()
+    store.insert('BTC-USD', 60, candles(0, 600, 60), 0, 600)
+
+    result = store.select('BTC-USD', 60, 120, 240)
+
+    assert [candle[0] for candle in result] == [120, 180, 240]
+    assert result[0] == [120, 1.0, 2.0, 1.0, 2.0, 10.0]
+
+
+def test_store_open_bucket_not_covered():
+    store = cbpro.store.CandleStore()
+    now = int(time.time()) // 60 * 60
+
+    store.insert('BTC-USD', 60, candles(now - 600, now, 60), now - 600, now)
+
+    assert store.covered('BTC-USD', 60) == [(now - 600, now - 60)]
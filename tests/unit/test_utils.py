@@ -1,9 +1,11 @@
+from decimal import Decimal
 import datetime
 from math import ceil
 
 import pytest
 
-from cbpro.utils import get_time_intervals, get_intervals, time_interval_ok
+from cbpro.utils import get_time_intervals, get_intervals, time_interval_ok, merge_candles, \
+    get_missing_intervals, merge_intervals, Intervals, get_places, get_fixed
 
 
 def test_window_size_ok():
@@ -78,3 +80,80 @@ def test_get_time_intervals_multiple_intervals():
         (datetime.datetime(2020, 3, 7, 0, 0, tzinfo=tzinfo), end),
         (start, datetime.datetime(2020, 3, 7, 0, 0, tzinfo=tzinfo)),
     ]
+
+
+def test_merge_candles():
+    # arrange
+    first = [[300, 1, 2, 1, 2, 10], [240, 1, 2, 1, 2, 10]]
+    second = [[240, 1, 2, 1, 2, 10], [180, 1, 2, 1, 2, 10]]
+
+    # act
+    result = merge_candles([first, second])
+
+    # assert
+    assert [candle[0] for candle in result] == [180, 240, 300]
+
+
+def test_get_missing_intervals():
+    # arrange
+    covered = [(120, 240), (480, 600)]
+
+    # act / assert
+    assert get_missing_intervals(0, 900, covered, 60) == [(0, 60), (300, 420), (660, 900)]
+    assert get_missing_intervals(120, 600, [(0, 900)], 60) == []
+    assert get_missing_intervals(0, 60, [], 60) == [(0, 60)]
+
+
+def test_merge_intervals():
+    assert merge_intervals([(300, 420), (0, 240)], 60) == [(0, 420)]
+    assert merge_intervals([(0, 60), (180, 240)], 60) == [(0, 60), (180, 240)]
+
+
+def test_intervals_aligned():
+    # arrange / act
+    intervals = Intervals(start=30, end=60 * 700 + 30, granularity=60)
+
+    # assert
+    assert len(intervals) == 3
+    assert list(intervals) == [(60, 18000), (18060, 36000), (36060, 42000)]
+    assert intervals[-1] == (36060, 42000)
+    assert all(start % 60 == 0 and end % 60 == 0 for start, end in intervals)
+
+
+def test_intervals_covered():
+    # arrange / act
+    intervals = Intervals(start=0, end=900, granularity=60, covered=[(120, 240)], max_candles=5)
+
+    # assert
+    assert list(intervals) == [(0, 60), (300, 540), (600, 840), (900, 900)]
+    assert [intervals[i] for i in range(len(intervals))] == list(intervals)
+    with pytest.raises(IndexError):
+        intervals[len(intervals)]
+
+
+def test_intervals_closed_form():
+    # arrange / act
+    intervals = Intervals(start=0, end=60 * 300 * 10 ** 6 - 60, granularity=60)
+
+    # assert
+    assert len(intervals) == 10 ** 6
+    assert intervals[123456] == (123456 * 18000, 123456 * 18000 + 17940)
+    assert len(Intervals(start=1, end=59, granularity=60)) == 0
+
+
+def test_get_fixed():
+    assert get_places('0.01000000') == 2
+    assert get_places('1') == 0
+    assert get_fixed('99.50', 2) == 9950
+    assert get_fixed('1.00000000', 8) == 100000000
+    assert get_fixed('7', 3) == 7000
+    assert get_fixed('1234567.12345678', 8) == 123456712345678
+    assert get_fixed('123456789012.123456789', 9) == 123456789012123456789
+    assert get_fixed(0.1, 1) == 1
+    assert get_fixed('99.75', 2, 25) == 9975
+    assert get_places('0.50') == 1
+    assert get_places(Decimal('1E-8')) == 8
+    with pytest.raises(ValueError):
+        get_fixed('99.505', 2)
+    with pytest.raises(ValueError):
+        get_fixed('99.70', 2, 25)
@@ -0,0 +1,37 @@
+import cbpro.codec
+import cbpro.websocket
+
+
+class DummyConnection(object):
+    connected = True
+
+    def __init__(self, frames: list) -> None:
+        self.frames = list(frames)
+        self.sent = []
+
+    def send(self, payload: bytes) -> None:
+        self.sent.append(payload)
+
+    def recv(self) -> str:
+        return self.frames.pop(0).decode('utf-8')
+
+    def recv_data(self) -> tuple:
+        return 1, self.frames.pop(0)
+
+
+def test_websocket_stream_codec():
+    codec = cbpro.codec.get_codec('json')
+    stream = cbpro.websocket.WebsocketStream(codec=codec)
+    stream.connection = DummyConnection([b'{"type": "heartbeat"}'])
+
+    stream.send(cbpro.websocket.get_message())
+
+    assert stream.receive() == {'type': 'heartbeat'}
+    assert codec.loads(stream.connection.sent[0])['type'] == 'subscribe'
+
+
+def test_websocket_stream_binary():
+    stream = cbpro.websocket.WebsocketStream(binary=True)
+    stream.connection = DummyConnection([b'{"type": "heartbeat"}'])
+
+    assert stream.receive() == {'type': 'heartbeat'}